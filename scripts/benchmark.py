@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import regex as re
+import argparse
+import collections
+import os
+import random
+import sys
+import time
+import timeit
+import tracemalloc
+from collections import OrderedDict
+
+import split_records as sr
+
+AUTHOR_LISTS = [
+    "Антонов С., Носов Н. и Сотник Ю. Рассказы. М., Детгиз, 1960. 64 стр.",
+    "Бианки В. и Чаплина В. Лесные жители. Л., Детгиз, 1955. 48 стр.",
+    "Ильф И. и Петров Е. Двенадцать стульев. Роман. М., «Сов. писатель», 1956.",
+    "Гримм, братья и Перро Ш. Сказки. Рис. Ю. Васнецова. М., Детгиз, 1959.",
+    "Петров (Бирюк) Д., Иванов Иван Ильич и Сидоров А. Б. Повести. М., 1958.",
+]
+
+
+PATHOLOGICAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'pathological.txt')
+FUZZ_TOKENS = ["Иванов ", "Пе. ", "И. ", "ИВАНОВ ", ", ", ". ", " и ", "и др. ",
+               "(", ")", "[", "]", "-", "—", "/", "Иван ", "де ", "проф. "]
+
+
+def legacy_multi_author():
+    """The regex that detected multi-author records before AuthorListScanner"""
+    return re.compile(r'(?<all>' + sr.AUTHOR_NAME +
+                      r'((\s+и\s+|,\s+)' + sr.AUTHOR_NAME + r')+' +
+                      r')[\W\s]+(?<tail>.*)$', re.U | re.VERBOSE)
+
+
+class LegacyRecord(OrderedDict):
+    """The record type before the slotted Record: a dict per record"""
+    def __init__(self, tail='', start=0, end=0):
+        super(LegacyRecord, self).__init__()
+        self.tail = tail
+        self.start = start
+        self.end = end
+        self.offset = None
+        self.length = None
+        self.volume = None
+        self.section = ''
+
+
+def corpus_batches(paths):
+    """Tail columns of the given txt volumes as split_volume batches them,
+    page furniture and headings stripped and the lines rejoined: a list
+    of (tails, volume name) pairs of up to BATCH_SIZE records
+    """
+    headings = sr.load_headings(sr.SECTIONS_FILE)
+    rejoiner = sr.Rejoiner()
+    columns = []
+    for path in paths:
+        with sr.Volume(path) as volume:
+            sections = sr.SectionTracker(headings)
+            lines = sections.strip(sr.PageFurniture().strip(volume.lines()))
+            records = sections.label(sr.iter_records(lines, join=rejoiner))
+            name = sr.volume_name(path)
+            columns.extend((batch.tail, name) for batch in sr.batches(records, fields=()))
+    return columns
+
+
+def corpus_tails(paths):
+    """Record tails of the given txt volumes"""
+    return [tail for tails, _ in corpus_batches(paths) for tail in tails]
+
+
+def report(name, n, seconds):
+    print("{:<28} {:>9} recs {:>8.3f} s {:>10.0f} recs/s".format(
+        name, n, seconds, n / seconds if seconds else float('inf')))
+
+
+def bench_authors(args):
+    """Multi-author detection and formatting: regex vs. scanner"""
+    legacy = legacy_multi_author()
+    name = re.compile(sr.AUTHOR_NAME, re.U | re.VERBOSE)
+    extractor = sr.AuthorExtractor()
+    scanner = extractor.multi_author
+    tails = AUTHOR_LISTS * args.repeat
+    if args.txt:
+        tails = [t for t in corpus_tails(args.txt) if scanner.match(t)]
+
+    def run_legacy():
+        for t in tails:
+            m = legacy.match(t)
+            if m:
+                all = m.group('all')
+                "; ".join(extractor.format_author(a) for a in
+                          name.finditer(all if all.endswith('.') else all + '.'))
+
+    def run_scanner():
+        for t in tails:
+            m = scanner.match(t)
+            if m:
+                extractor.format_multi_authors(m.group('authors'))
+
+    for label, func in (('regex + finditer', run_legacy),
+                        ('AuthorListScanner', run_scanner)):
+        report(label, len(tails), min(timeit.repeat(func, number=1, repeat=3)))
+
+
+def fuzz(seeds, n, rng):
+    """Generate n mutants of the seed strings by inserting runs of
+    name-like tokens and punctuation at random positions.
+    """
+    out = []
+    for _ in range(n):
+        s = rng.choice(seeds)
+        pos = rng.randrange(len(s) + 1)
+        run = ''.join(rng.choice(FUZZ_TOKENS) for _ in range(rng.randint(1, 60)))
+        out.append(s[:pos] + run + s[pos:])
+    return out
+
+
+def bench_patterns(args):
+    """Worst-case match time per author pattern on pathological and fuzzed input"""
+    extractor = sr.AuthorExtractor()
+    patterns = [('multi', extractor.multi_author), ('others', extractor.and_others),
+                ('one', extractor.one_author), ('single', extractor.single_name_authors),
+                ('dash', extractor.dash), ('noauthor', extractor.noauthor_tag),
+                ('tag', extractor.author_tag)]
+    inputs = sr.load_names(args.corpus)
+    inputs += fuzz(inputs + AUTHOR_LISTS, args.fuzz, random.Random(args.seed))
+    print("{:<10} {:>12} {:>12}  {}".format('pattern', 'mean, us', 'max, us', 'worst input'))
+    for name, pattern in patterns:
+        times = []
+        for s in inputs:
+            t = time.perf_counter()
+            try:
+                pattern.match(s, timeout=args.timeout)
+            except TimeoutError:
+                pass
+            times.append((time.perf_counter() - t, s))
+        worst, s = max(times)
+        print("{:<10} {:>12.1f} {:>12.1f}  {}".format(
+            name, 1e6 * sum(t for t, _ in times) / len(times), 1e6 * worst, s[:50]))
+
+
+def volume_authors(path, extractor, join):
+    """Authors of the records of a txt volume by the record start line"""
+    with open(path, encoding='UTF-8') as f:
+        lines = sr.PageFurniture().strip(sr.numbered_lines(f))
+        records = sr.iter_records(lines, join=join)
+        return {rec.start: rec['author'] for rec in sr.extract_authors(records, extractor)}
+
+
+def author_status(author):
+    return author if author in ('NOAUTHOR', 'ERRAUTHOR') else 'author'
+
+
+def bench_rejoin(args):
+    """Author extraction with plain and repaired joining of record lines"""
+    extractor = sr.AuthorExtractor()
+    rejoiner = sr.Rejoiner()
+    moves = collections.Counter()
+    changed = 0
+    for path in args.txt:
+        t = time.perf_counter()
+        plain = volume_authors(path, extractor, ' '.join)
+        t1 = time.perf_counter()
+        repaired = volume_authors(path, extractor, rejoiner)
+        t2 = time.perf_counter()
+        report(os.path.basename(path) + ' plain', len(plain), t1 - t)
+        report(os.path.basename(path) + ' rejoined', len(repaired), t2 - t1)
+        for start, author in repaired.items():
+            before = plain.get(start)
+            if before is not None and before != author:
+                changed += 1
+                moves[author_status(before), author_status(author)] += 1
+                if args.verbose:
+                    print("{}: {} -> {}".format(start, before, author))
+    print("repairs: {}".format(dict(rejoiner.repairs)))
+    print("changed authors: {}".format(changed))
+    for (before, after), n in moves.most_common():
+        print("{:<10} -> {:<10} {:>6}".format(before, after, n))
+
+
+def retained(path, record_type, collect):
+    """Memory (bytes) retained by collect() of the extracted records of
+    a volume, built as record_type, and the number of records
+    """
+    saved, sr.Record = sr.Record, record_type
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        with sr.Volume(path) as volume:
+            lines = sr.PageFurniture().strip(volume.lines())
+            records = sr.iter_records(lines)
+            kept = collect(sr.extract_authors(records, sr.AuthorExtractor()))
+        n = sum(len(x) if isinstance(x, sr.RecordBatch) else 1 for x in kept)
+        return tracemalloc.get_traced_memory()[0] - base, n
+    finally:
+        tracemalloc.stop()
+        sr.Record = saved
+
+
+def bench_memory(args):
+    """Memory held by the records of a volume: OrderedDict, slotted, columnar"""
+    print("{:<28} {:>9} {:>10} {:>10}".format('representation', 'recs', 'MB', 'B/rec'))
+    for label, record_type, collect in (
+            ('tails only', sr.Record, lambda recs: [rec.tail for rec in recs]),
+            ('OrderedDict Record', LegacyRecord, list),
+            ('slotted Record', sr.Record, list),
+            ('RecordBatch', sr.Record, lambda recs: list(sr.batches(recs)))):
+        size = n = 0
+        for path in args.txt:
+            s, k = retained(path, record_type, collect)
+            size += s
+            n += k
+        print("{:<28} {:>9} {:>10.1f} {:>10.0f}".format(label, n, size / 2**20, size / n))
+
+
+def bench_fields(args):
+    """Description field extraction over the records of the volumes"""
+    extractor = sr.AuthorExtractor()
+    fields = sr.FieldExtractor()
+    records = []
+    for path in args.txt:
+        with sr.Volume(path) as volume:
+            lines = sr.PageFurniture().strip(volume.lines())
+            records.extend(sr.extract_authors(sr.iter_records(lines), extractor))
+    tails = [rec.tail for rec in records]
+
+    def run():
+        for rec, tail in zip(records, tails):
+            rec.tail = tail
+            fields.extract(rec)
+
+    report('FieldExtractor', len(records), min(timeit.repeat(run, number=1, repeat=args.repeat)))
+    print("{:<12} {:>6}".format('field', 'found'))
+    for name in fields.fields:
+        print("{:<12} {:>5.1f}%".format(
+            name, 100 * sum(1 for rec in records if getattr(rec, name)) / len(records)))
+
+
+def bench_printruns(args):
+    """Printrun parsing over the tail columns of the volumes"""
+    parser = sr.PrintrunParser()
+    columns = [tails for tails, _ in corpus_batches(args.txt)]
+    n = sum(map(len, columns))
+    report('PrintrunParser', n, min(timeit.repeat(
+        lambda: [parser.parse(column) for column in columns],
+        number=1, repeat=args.repeat)))
+    parsed = [parser.parse(column) for column in columns]
+    found = sum(1 for cols in parsed for v in cols['printrun_total'] if v >= 0)
+    ranges = sum(1 for cols in parsed for v in cols['print_to'] if v >= 0)
+    ambiguous = sum(sum(cols['printrun_ambiguous']) for cols in parsed)
+    print("printrun {:.1%}, cumulative range {:.1%}, ambiguous {:.1%}".format(
+        found / n, ranges / n, ambiguous / n))
+
+
+def bench_prices(args):
+    """Page and price parsing over the tail columns of the volumes"""
+    parser = sr.PriceParser()
+    columns = corpus_batches(args.txt)
+    n = sum(len(column) for column, _ in columns)
+    report('PriceParser', n, min(timeit.repeat(
+        lambda: [parser.parse(column, volume) for column, volume in columns],
+        number=1, repeat=args.repeat)))
+    parsed = [parser.parse(column, volume) for column, volume in columns]
+    print(", ".join("{} {:.1%}".format(field, sum(1 for cols in parsed for v in cols[field] if v >= 0) / n)
+                    for field in parser.fields))
+
+
+def bench_years(args):
+    """Year parsing over the tail columns of the volumes"""
+    parser = sr.YearParser()
+    columns = corpus_batches(args.txt)
+    n = sum(len(column) for column, _ in columns)
+    report('YearParser', n, min(timeit.repeat(
+        lambda: [parser.parse(column, volume) for column, volume in columns],
+        number=1, repeat=args.repeat)))
+    parsed = [parser.parse(column, volume) for column, volume in columns]
+    found = sum(1 for cols in parsed for v in cols['year'] if v >= 0)
+    out = sum(sum(cols['year_out_of_range']) for cols in parsed)
+    print("year {:.1%}, out of range {:.1%}".format(found / n, out / n))
+
+
+def bench_ages(args):
+    """Age group classification over the tail columns of the volumes"""
+    classifier = sr.AgeClassifier(sr.load_age_groups(sr.AGE_GROUPS_FILE))
+    columns = [tails for tails, _ in corpus_batches(args.txt)]
+    n = sum(map(len, columns))
+    report('AgeClassifier', n, min(timeit.repeat(
+        lambda: [classifier.parse(column) for column in columns],
+        number=1, repeat=args.repeat)))
+    parsed = [classifier.parse(column) for column in columns]
+    print(", ".join("{} {:.1%}".format(flag, sum(sum(cols[flag]) for cols in parsed) / n)
+                    for flag in classifier.fields))
+
+
+def synthetic_entries(n, rng):
+    """n made-up publisher entries, each with a name and an abbreviation"""
+    letters = 'абвгдежзиклмнопрстуфхцчшщэюя'
+    entries, taken = [], set()
+    while len(entries) < n:
+        name = ''.join(rng.choice(letters) for _ in range(rng.randint(6, 12)))
+        short = name[:rng.randint(3, 5)]
+        if name not in taken and short not in taken:
+            taken.update((name, short))
+            entries.append(('publisher', name.capitalize(), (name, short + '.')))
+    return entries
+
+
+def bench_gazetteer(args):
+    """Gazetteer tagging over the tail columns, with made-up entries added"""
+    entries = sr.load_gazetteer(sr.GAZETTEER_FILE)
+    columns = [tails for tails, _ in corpus_batches(args.txt)]
+    n = sum(map(len, columns))
+    rng = random.Random(args.seed)
+    for extra in [0] + args.extra:
+        gazetteer = sr.Gazetteer(entries + synthetic_entries(extra, rng))
+        report('Gazetteer +{}'.format(extra), n, min(timeit.repeat(
+            lambda: [gazetteer.parse(column) for column in columns],
+            number=1, repeat=args.repeat)))
+    gazetteer = sr.Gazetteer(entries)
+    parsed = [gazetteer.parse(column) for column in columns]
+    print(", ".join("{} {:.1%}".format(field, sum(1 for cols in parsed for v in cols[field] if v)
+                                                / n)
+                    for field in gazetteer.fields))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmarks for split_records.py')
+    sub = parser.add_subparsers(dest='bench')
+    authors = sub.add_parser('authors', help=bench_authors.__doc__)
+    authors.add_argument('txt', nargs='*', help='Take multi-author records '
+                         'from these volumes instead of the built-in samples')
+    authors.add_argument('-n', '--repeat', type=int, default=2000,
+                         help='Repetitions of the built-in samples')
+    authors.set_defaults(func=bench_authors)
+    patterns = sub.add_parser('patterns', help=bench_patterns.__doc__)
+    patterns.add_argument('corpus', nargs='?', default=PATHOLOGICAL_FILE,
+                          help='Pathological inputs, one per line '
+                          '(default: %(default)s)')
+    patterns.add_argument('-n', '--fuzz', type=int, default=5000,
+                          help='Number of fuzzed inputs')
+    patterns.add_argument('-s', '--seed', type=int, default=0)
+    patterns.add_argument('-t', '--timeout', type=float, default=1.0,
+                          help='Per-match timeout, seconds')
+    patterns.set_defaults(func=bench_patterns)
+    rejoin = sub.add_parser('rejoin', help=bench_rejoin.__doc__)
+    rejoin.add_argument('txt', nargs='+', help='Volumes to compare')
+    rejoin.add_argument('-v', '--verbose', action='store_true',
+                        help='Print every changed author')
+    rejoin.set_defaults(func=bench_rejoin)
+    fields = sub.add_parser('fields', help=bench_fields.__doc__)
+    fields.add_argument('txt', nargs='+', help='Volumes to extract from')
+    fields.add_argument('-n', '--repeat', type=int, default=3)
+    fields.set_defaults(func=bench_fields)
+    printruns = sub.add_parser('printruns', help=bench_printruns.__doc__)
+    printruns.add_argument('txt', nargs='+', help='Volumes to parse')
+    printruns.add_argument('-n', '--repeat', type=int, default=3)
+    printruns.set_defaults(func=bench_printruns)
+    prices = sub.add_parser('prices', help=bench_prices.__doc__)
+    prices.add_argument('txt', nargs='+', help='Volumes to parse')
+    prices.add_argument('-n', '--repeat', type=int, default=3)
+    prices.set_defaults(func=bench_prices)
+    years = sub.add_parser('years', help=bench_years.__doc__)
+    years.add_argument('txt', nargs='+', help='Volumes to parse')
+    years.add_argument('-n', '--repeat', type=int, default=3)
+    years.set_defaults(func=bench_years)
+    ages = sub.add_parser('ages', help=bench_ages.__doc__)
+    ages.add_argument('txt', nargs='+', help='Volumes to classify')
+    ages.add_argument('-n', '--repeat', type=int, default=3)
+    ages.set_defaults(func=bench_ages)
+    gazetteer = sub.add_parser('gazetteer', help=bench_gazetteer.__doc__)
+    gazetteer.add_argument('txt', nargs='+', help='Volumes to tag')
+    gazetteer.add_argument('-n', '--repeat', type=int, default=3)
+    gazetteer.add_argument('--extra', type=int, nargs='*', default=[1000, 5000],
+                           help='Numbers of made-up entries to add')
+    gazetteer.add_argument('--seed', type=int, default=1)
+    gazetteer.set_defaults(func=bench_gazetteer)
+    memory = sub.add_parser('memory', help=bench_memory.__doc__)
+    memory.add_argument('txt', nargs='+', help='Volumes to load')
+    memory.set_defaults(func=bench_memory)
+    args = parser.parse_args()
+    if args.bench is None:
+        parser.print_help()
+        sys.exit(1)
+    return args
+
+
+def main():
+    args = parse_arguments()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
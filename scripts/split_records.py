@@ -4,8 +4,17 @@
 import regex as re
 import csv
 import argparse
+import glob
+import mmap
+import multiprocessing
+import os
 import sys
-from collections import OrderedDict
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from itertools import chain, repeat
 from string import Formatter
 
 AUTHOR_NAME = r"""
@@ -44,55 +53,29 @@ INI_AUTHOR = r"""
 (?<ini>\p{Lu}\p{Ll}{0,2}\.([\s-]?\p{Lu}\p{Ll}{0,2}\.)?)\s+
 (?<last>\p{Lu}\p{Ll}+(-\p{Lu}\p{Ll}+)?)
 """
-SINGLE_AUTHORS = r"""
-Aaсамурти|
-Айбек|
-Алтан-Хайша|
-Алтыншаш|
-Анко|
-Антониорроблес|
-Аригапуди|
-Аткай|
-Гайрати|
-Гомер|
-Джамбул|
-Елин-Пелин|
-Конан-Дойль|
-Кукрыниксы|
-Лесник|
-Луда|
-Магомед-Расул|
-Майн-Рид|
-Мирмухсин|
-Миртемир|
-Михайлова|
-Мольер|
-Мультатули|
-Обос-Апер|
-Плутарх|
-Решетов-Жнивник|
-Садов|
-Сайяр|
-Сан-Марку|
-Сат-Окх|
-Стендаль|
-Уйда|
-Улуро Адо|
-Физули|
-Фирдоуси|
-Фуиг-Куан|
-Хнко-Апер|
-Шанкар|
-Шолом-Алейхем|
-Эзоп|
-Элляй|
-Эль-Регистан|
-Эльчин|
-Энба|
-Эсхил|
-д’Актиль|
-д’Эрвильи
-"""
+# Author tag of a '—' record (same author as the previous one) until the
+# previous author is known, see resolve_authors()
+DITTO = "DITTO"
+# UTF-8 encoded characters that str.strip() treats as whitespace, except
+# the line feed
+BYTES_WS = (rb"(?:[\t\x0b-\r\x1c-\x20]|\xc2[\x85\xa0]|\xe1\x9a\x80|"
+            rb"\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)")
+SINGLE_AUTHORS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'single_authors.txt')
+# Title of the book printed at the top of the pages, see PageFurniture
+RUNNING_TITLE = "Детская литература"
+BATCH_SIZE = 1024
+# the reviews of a book («Рец.:», also «Рец:», «Ред.:»), which end its
+# description: the parsers do not look for its fields after them
+REVIEWS = re.compile(r"(?<!\p{L})Р[^\S\n]?е[^\S\n]?[цд][^\S\n]?\.?[^\S\n]?:")
+DESCRIPTION_FIELDS = ('title', 'genre', 'illustrator', 'place', 'publisher', 'year',
+                      'series', 'pages', 'printrun', 'price', 'age')
+SECTIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'sections.txt')
+AGE_GROUPS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'age_groups.txt')
+GAZETTEER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'gazetteer.txt')
 
 
 class ExtendedFormatter(Formatter):
@@ -123,15 +106,27 @@ class ExtendedFormatter(Formatter):
         return super(ExtendedFormatter, self).convert_field(value, conversion)
 
 
+ITEM_SUFFIXES = {None: 0, 'a': 1, 'а': 1, 'б': 2}
+ITEM_LETTERS = ('', 'а', 'б', '')
+ITEM_NUMBER = re.compile(r"(?<num>[1-9][0-9]*)(?<suffix>[aаб])?$")
+ITEM_RANGE = re.compile(r"""
+    (?<![0-9])(?<first>[1-9][0-9]*)(?<fsuffix>[aаб])?\b
+    (?:\s*[—–-]\s*(?<last>[1-9][0-9]*)(?<lsuffix>[aаб])?\b)?
+    """, re.VERBOSE)
+
+
 class BibItem(object):
     """A class to hold a sequential bibliographic number.  In contrast to
     the standard integer it can have a letter suffix for the items
-    inserted in the list. The class provides methods for comparison of
-    standard and suffixed numbers for correct item numebering and
-    alignment.  Supports operations with integers: comparison,
-    addition, subtraction. These result in integers in all cases.
-    Similar operations with two BibItems result in a BibItem.
+    inserted in the list (12а, 12б follow 12 and precede 13).
+
+    Ordering, equality and hashing follow the packed integer key (see
+    item_key()), also with integers: BibItem(12, 1) > 12, < 13 and is
+    not equal to either. Other types are not comparable. Addition and subtraction work on the plain
+    numbers, the suffix is dropped, and result in integers.
     """
+    __slots__ = ('num', 'suffix', 'key')
+
     def __init__(self, num=0, suffix=0, string=None):
         if string is None:
             self.num = num
@@ -140,73 +135,599 @@ class BibItem(object):
             self.num = 0
             self.suffix = 0
         else:
-            m = re.match(r"(?<num>[1-9][0-9]*)(?<suffix>[aаб])?$", string)
-            suffixdict = {None: 0, 'a': 1, 'а': 1, 'б': 2}
-            try:
-                self.num = int(m.group('num'))
-                self.suffix = suffixdict[m.group('suffix')]
-            except AttributeError:
+            m = ITEM_NUMBER.match(string)
+            if m is None:
                 raise ValueError("Incorrect value for BibItem: %s" % string)
-        self.value = (self.num, self.suffix)
+            self.num = int(m.group('num'))
+            self.suffix = ITEM_SUFFIXES[m.group('suffix')]
+        self.key = self.num * 4 + self.suffix
+
+    @classmethod
+    def from_key(cls, key):
+        return cls(key >> 2, key & 3)
+
+    @property
+    def value(self):
+        return (self.num, self.suffix)
 
     def __str__(self):
-        numtosuf = {0: '', 1: 'а', 2: 'б'}
-        return ''.join([str(self.num), numtosuf[self.suffix]])
+        return str(self.num) + ITEM_LETTERS[self.suffix]
 
-    def __eq__(self, other):
+    def __repr__(self):
+        return "BibItem('%s')" % self
+
+    def __hash__(self):
+        return hash(self.num) if self.suffix == 0 else hash(self.value)
+
+    @staticmethod
+    def other_key(other):
+        """The key of an item or an integer compared with, None for
+        anything else (a string is not an item number)
+        """
+        if isinstance(other, BibItem):
+            return other.key
         if isinstance(other, int):
-            return self.num + self.suffix == other
-        else:
-            return self.value == other.value
+            return other * 4
+        return None
+
+    def __eq__(self, other):
+        key = self.other_key(other)
+        return NotImplemented if key is None else self.key == key
+
+    def __ne__(self, other):
+        key = self.other_key(other)
+        return NotImplemented if key is None else self.key != key
 
     def __lt__(self, other):
-        if isinstance(other, int):
-            return self.num + self.suffix < other
-        else:
-            return self.value < other.value
+        key = self.other_key(other)
+        return NotImplemented if key is None else self.key < key
+
+    def __le__(self, other):
+        key = self.other_key(other)
+        return NotImplemented if key is None else self.key <= key
 
     def __gt__(self, other):
-        if isinstance(other, int):
-            return self.num + self.suffix > other
-        else:
-            return self.value > other.value
+        key = self.other_key(other)
+        return NotImplemented if key is None else self.key > key
+
+    def __ge__(self, other):
+        key = self.other_key(other)
+        return NotImplemented if key is None else self.key >= key
 
     def __add__(self, other):
-        if isinstance(other, int):
-            return self.num + self.suffix + other
-        else:
-            return self.num + other.num + self.suffix + other.suffix
+        return self.num + (other if isinstance(other, int) else other.num)
 
     def __sub__(self, other):
-        if isinstance(other, int):
-            return self.num + self.suffix - other
-        else:
-            return self.num + self.suffix - other.num - other.suffix
+        return self.num - (other if isinstance(other, int) else other.num)
+
+
+def item_key(num):
+    """Pack an item number (BibItem, int or a string like '2743а') into
+    an integer that sorts in the item order: num * 4 + suffix
+    """
+    if isinstance(num, BibItem):
+        return num.key
+    if isinstance(num, str):
+        if num == '0':
+            return 0
+        m = ITEM_NUMBER.match(num)
+        if m is None:
+            raise ValueError("Incorrect item number: %s" % num)
+        return int(m.group('num')) * 4 + ITEM_SUFFIXES[m.group('suffix')]
+    return num * 4
+
+
+def item_str(key):
+    """The item number of a packed key as a string: '2743а'"""
+    return str(key >> 2) + ITEM_LETTERS[key & 3]
+
+
+def item_keys(text):
+    """Packed keys of all the item numbers in text, a list of references
+    like '829, 1126, 1139— 1141, 2743а' (as in the name indexes), with
+    the ranges expanded, in an array of 64-bit integers
+    """
+    keys = array('q')
+    for first, fsuffix, last, lsuffix in ITEM_RANGE.findall(text):
+        a = int(first) * 4 + ITEM_SUFFIXES[fsuffix or None]
+        keys.append(a)
+        if last:
+            b = int(last) * 4 + ITEM_SUFFIXES[lsuffix or None]
+            if b > a:
+                keys.extend(range(((a >> 2) + 1) * 4, (b >> 2) * 4 + 1, 4))
+                if b & 3:
+                    keys.append(b)
+            else:
+                # not a range: an OCR error in one of the numbers
+                keys.append(b)
+    return keys
+
+
+class ItemIndex(object):
+    """Sidecar index of a volume: item numbers mapped to the byte offset
+    and length of their records in the txt file.
+
+    Stored as a small header and three arrays of 64-bit integers (packed
+    item keys in ascending order, offsets, lengths), so a lookup is a
+    binary search. Build it with collect() while the records stream by,
+    or add() RecordBatches, then save(); load() it later to fetch records
+    without reparsing.
+    """
+    magic = b'BIBIDX1\n'
+
+    def __init__(self):
+        self.keys = array('q')
+        self.offsets = array('q')
+        self.lengths = array('q')
+        self.entries = []
+
+    def __len__(self):
+        return len(self.keys) + len(self.entries)
+
+    def collect(self, records):
+        """Pass records through, remembering their item numbers and spans"""
+        for rec in records:
+            self.entries.append((item_key(rec['num']), rec.offset, rec.length))
+            yield rec
+
+    def add(self, batch):
+        """Remember the item numbers and spans of a RecordBatch"""
+        self.entries.extend(zip(batch.key, batch.offset, batch.length))
+
+    def _merge(self):
+        if self.entries:
+            entries = sorted(list(zip(self.keys, self.offsets, self.lengths)) +
+                             self.entries, key=lambda e: e[0])
+            self.keys = array('q', [e[0] for e in entries])
+            self.offsets = array('q', [e[1] for e in entries])
+            self.lengths = array('q', [e[2] for e in entries])
+            self.entries = []
+
+    def save(self, path):
+        self._merge()
+        with open(path, 'wb') as f:
+            f.write(self.magic)
+            array('q', [len(self.keys)]).tofile(f)
+            for a in (self.keys, self.offsets, self.lengths):
+                a.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        with open(path, 'rb') as f:
+            if f.read(len(cls.magic)) != cls.magic:
+                raise ValueError("Not an item index: %s" % path)
+            n = array('q')
+            n.fromfile(f, 1)
+            for a in (index.keys, index.offsets, index.lengths):
+                a.fromfile(f, n[0])
+        return index
+
+    def lookup(self, item):
+        """Return (offset, length) of an item (BibItem, int or string)"""
+        self._merge()
+        key = item_key(item)
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            raise KeyError(str(item))
+        return self.offsets[i], self.lengths[i]
+
+    def join(self, keys):
+        """Merge join of packed item keys (e.g. from item_keys()) with the
+        index: yields (key, offset, length) for each of the keys found,
+        in the key order
+        """
+        self._merge()
+        i, n = 0, len(self.keys)
+        for key in sorted(keys):
+            i = bisect_left(self.keys, key, i, n)
+            if i == n:
+                break
+            if self.keys[i] == key:
+                yield key, self.offsets[i], self.lengths[i]
+
+    def fetch(self, item, path):
+        """Read the source text of an item from the txt file at path"""
+        offset, length = self.lookup(item)
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length).decode('UTF-8')
 
 
-class Record(OrderedDict):
+class Record(object):
+    """A bibliographic item. The extracted fields are accessed like a
+    dict, rec['num'], rec['author'], rec['title'], and are serialized in
+    the order of Record.fields; the rest (tail, line numbers, offsets)
+    are attributes. A field that is not set (None, or not assigned at
+    all, like the description fields before FieldExtractor) is missing
+    from the mapping.
+
+    The contents list of a collection is kept apart from the tail, see
+    Contents.
+
+    Slotted: no per-instance dict, since a corpus has a few hundred
+    thousand of them. See RecordBatch for the columnar storage.
+    """
+    fields = ('num', 'author') + DESCRIPTION_FIELDS
+    __slots__ = fields + ('tail', 'start', 'end', 'offset', 'length',
+                          'volume', 'section', 'contents')
+
     def __init__(self, tail='', start=0, end=0):
-        super(Record, self).__init__()
+        self.num = None
+        self.author = None
         self.tail = tail
         self.start = start
         self.end = end
+        self.offset = None
+        self.length = None
+        self.volume = None
+        self.section = ''
+        self.contents = ''
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            value = getattr(self, key, None)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.fields and getattr(self, key, None) is not None
 
-    def serialize(self):
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(k, v) for k, v in ((k, getattr(self, k, None)) for k in self.fields)
+                if v is not None]
+
+    def raw(self):
+        """Source bytes of the record: a memoryview into the volume, no copy"""
+        return self.volume.view(self.offset, self.length)
+
+    def source_text(self):
+        """Source text of the record, decoded on demand"""
+        return str(self.raw(), 'UTF-8')
+
+    def serialize(self, offsets=False):
         out = []
         out.append(self.start)
         out.append(self.end)
+        if offsets:
+            out.append(self.offset)
+            out.append(self.length)
         for k, v in self.items():
             out.append(str(v))
-        out.append(self.tail)
+        out.append(self.tail + self.contents)
         return out
 
 
+class RecordBatch(object):
+    """Records stored by columns: packed item keys (see item_key()), line
+    numbers, offsets and lengths in arrays of 64-bit integers (-1 for a
+    missing offset), the fields, tails and sections in parallel lists.
+
+    Filled with append() at the end of the pipeline (see batches()); the
+    sinks read the columns directly: rows() for the CSV writer,
+    ItemIndex.add() for the index. Only the given fields are stored.
+    Columns computed over the whole batch (see PrintrunParser) are
+    added to numbers: integer arrays, -1 for a missing value, written
+    after the fields; and to labels: lists of strings (see Gazetteer),
+    written after the numbers.
+    """
+    def __init__(self, fields=('num', 'author')):
+        self.key = array('q')
+        self.start = array('q')
+        self.end = array('q')
+        self.offset = array('q')
+        self.length = array('q')
+        self.fields = {name: [] for name in fields}
+        self.tail = []
+        self.section = []
+        self.contents = []
+        self.numbers = OrderedDict()
+        self.labels = OrderedDict()
+
+    def __len__(self):
+        return len(self.start)
+
+    def append(self, rec):
+        self.key.append(item_key(rec.num))
+        self.start.append(rec.start)
+        self.end.append(rec.end)
+        self.offset.append(-1 if rec.offset is None else rec.offset)
+        self.length.append(-1 if rec.length is None else rec.length)
+        for name, column in self.fields.items():
+            column.append(getattr(rec, name, None))
+        self.tail.append(rec.tail)
+        self.section.append(rec.section)
+        self.contents.append(rec.contents)
+
+    def record(self, i):
+        """The i-th record as a Record (without the volume)"""
+        rec = Record(self.tail[i], self.start[i], self.end[i])
+        if self.offset[i] >= 0:
+            rec.offset, rec.length = self.offset[i], self.length[i]
+        for name, column in self.fields.items():
+            setattr(rec, name, column[i])
+        rec.section = self.section[i]
+        rec.contents = self.contents[i]
+        return rec
+
+    def __iter__(self):
+        return map(self.record, range(len(self)))
+
+    def rows(self, offsets=False, section=False, volume=None, contents=True):
+        """CSV rows, as Record.serialize() would give them, optionally
+        prefixed with the volume name and the section. The contents lists
+        cut off by Contents are put back at the end of the tails, unless
+        contents is False.
+        """
+        columns = []
+        if volume is not None:
+            columns.append(repeat(volume, len(self)))
+        if section:
+            columns.append(self.section)
+        columns += [self.start, self.end]
+        if offsets:
+            columns += [[None if v < 0 else v for v in self.offset],
+                        [None if v < 0 else v for v in self.length]]
+        for column in self.fields.values():
+            columns.append(['' if v is None else str(v) for v in column])
+        for column in self.numbers.values():
+            columns.append([None if v < 0 else v for v in column])
+        columns += self.labels.values()
+        if contents and any(self.contents):
+            columns.append([tail + rest for tail, rest in zip(self.tail, self.contents)])
+        else:
+            columns.append(self.tail)
+        return zip(*columns)
+
+
+def batches(records, size=BATCH_SIZE, fields=('num', 'author')):
+    """Collect records into RecordBatches of up to size records"""
+    batch = RecordBatch(fields)
+    for rec in records:
+        batch.append(rec)
+        if len(batch) == size:
+            yield batch
+            batch = RecordBatch(fields)
+    if batch:
+        yield batch
+
+
+class EdgeList(object):
+    """Author–illustrator edge list: a CSV row (volume, item number,
+    author, illustrator) for every pair of an author and an illustrator
+    of a record, written from the columns of the RecordBatches as they
+    pass, next to the records themselves. The names are those of the
+    author and illustrator columns (see FieldExtractor), so the network
+    needs neither a second pass nor the item ranges of the printed
+    indexes (see illustrators_network.R). The tags of the author column
+    (NOAUTHOR, ERRAUTHOR, ERRTIMEOUT, OTHERS for «и др.») give no edges.
+    """
+    header = ('volume', 'num', 'author', 'illustrator')
+    tags = ('NOAUTHOR', 'ERRAUTHOR', 'ERRTIMEOUT', 'OTHERS')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.writer.writerow(self.header)
+        self.count = 0
+
+    def add(self, batch, volume):
+        """Write the edges of a RecordBatch of a volume"""
+        rows = []
+        for key, author, illustrator in zip(batch.key, batch.fields['author'],
+                                            batch.fields['illustrator']):
+            if not illustrator or not author:
+                continue
+            num = item_str(key)
+            for name in author.split('; '):
+                if name in self.tags:
+                    continue
+                rows.extend((volume, num, name, artist) for artist in illustrator.split('; '))
+        self.writer.writerows(rows)
+        self.count += len(rows)
+
+
+class Contents(object):
+    """Contents lists of the collections, «Содерж.: Утром. — Солнечный
+    зайчик. — ...».
+
+    cut() takes the list (up to the end of the record) off the tails
+    before the author and field extraction, which then only scan the
+    description: the lists are often longer than it. It is kept in
+    rec.contents, and RecordBatch.rows() puts it back, unless it goes to
+    the contents table: add() writes a CSV row (volume, item, position,
+    author, title) for every entry of the records of a RecordBatch.
+
+    The entries are separated by dashes (1940s to 1970s), or by dots and
+    semicolons (1930s; 1980s, with the author after a slash: «Скворцы/
+    Куприн А. И.», the titles joined by semicolons share it). An entry
+    may start with its author, «С. Антонов. Футбол», and the entries of
+    an anthology without one are by the last author named; otherwise
+    the author of the record is given. Notes (Пер., Рис...) and headings
+    (БОЛГАРИЯ., Стихи:) are dropped. The list stops at the reviews.
+    """
+    header = ('volume', 'num', 'position', 'author', 'title')
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        if writer:
+            writer.writerow(self.header)
+        self.count = 0
+        self.marker = re.compile(r"(?<!\p{L})С\s?о\s?д\s?е\s?р\s?ж\s?(?:\.|ание)")
+        self.body = re.compile(r"[\s.:;,]*(?<see>см\.)?")
+        self.dashes = re.compile(r"\s*[—–]+\s*")
+        # a dot after an initial or a short abbreviation does not end an
+        # entry
+        self.dots = re.compile(r"""\s*(?<sep>;)\s*
+            |(?<!(?<!\p{L})\p{Lu}\p{Ll}{0,2})\s*(?<sep>\.)\s+(?=[\p{Lu}«„"\d])""", re.VERBOSE)
+        surname = r"\p{Lu}\p{Ll}+(?:-\p{Lu}?\p{Ll}+)*"
+        initials = r"(?:\p{Lu}\p{Ll}?\.\s?){1,2}"
+        # the dot after the author is often lost: «А. Сурков Красноармейская»
+        self.initialled = re.compile(initials + r"\s?" + surname)
+        self.lead = re.compile(r"(?<who>" + self.initialled.pattern + r")"
+                               r"(?:\.\s+|\s+(?=[\p{Lu}\d«]))(?<title>\S.*)")
+        # «И. Фамилия», «Фамилия И. О.», «Имя Фамилия» after a slash
+        self.name = re.compile(r"(?<ini>" + initials + r")\s?(?<last>" + surname + r")"
+                               r"|(?<last>" + surname + r")\s+(?<ini>(?:\p{Lu}\.\s?){1,2})"
+                               r"|(?<ini>\p{Lu}\p{Ll}+)\s+(?<last>" + surname + r")")
+        # «Журавль и цапля/Пересказал А. Толстой»
+        self.role = re.compile(r"(?:[Пп]ересказ\p{L}*|[Оо]бработ\p{L}*|[Пп]ер\.|[Сс]ост\.)\s*")
+        self.names = re.compile(r"(?:" + self.name.pattern + r")(?:\s*,\s*(?:" +
+                                self.name.pattern + r"))*")
+        self.heading = re.compile(r"(?:[IVX]+\.\s*)?(?:\p{Lu}{2}[\p{Lu}\s-]*[.:]|\p{Lu}\p{Ll}+:)\s+"
+                                  r"(?=\S)|[IVX]+$")
+        self.genre = re.compile(r"\s*\(\s*" + GENRE + r"[^()]*\)$", re.VERBOSE)
+        self.note = re.compile(r"(?:^|\.\s+)(?:(?:Пер|Рис|Худож|Вступ|Вступит|Предисл|Послесл|"
+                               r"Коммент|Сост|Ред|Обраб|Лит|Илл|Оформл)[.,]|Вступительная статья)")
+
+    def cut(self, records):
+        """Pass records through with their contents lists cut off the tails"""
+        for rec in records:
+            m = self.marker.search(rec.tail)
+            if m:
+                rec.tail, rec.contents = rec.tail[:m.start()], rec.tail[m.start():]
+            yield rec
+
+    def format_names(self, text):
+        """Names at the start of text as 'Фамилия, И. О.; ...' and the end
+        of the names
+        """
+        m = self.names.match(text)
+        if m is None:
+            return '', 0
+        names = ["{}, {}".format(last, ' '.join(re.findall(r"\p{Lu}\p{Ll}*\.?", ini)))
+                 for ini, last in zip(m.captures('ini'), m.captures('last'))]
+        return '; '.join(names), m.end()
+
+    def pieces(self, text):
+        """The entries of a list with the separator after each: dashes
+        (the pieces starting with a small letter continue the entry) or
+        dots and semicolons
+        """
+        if self.dashes.search(text):
+            out = []
+            for piece in self.dashes.split(text):
+                if out and piece[:1].islower():
+                    out[-1] = (out[-1][0] + ' — ' + piece, '—')
+                elif piece:
+                    out.append((piece, '—'))
+            return out
+        out = []
+        pos = 0
+        for m in self.dots.finditer(text):
+            out.append((text[pos:m.start()], m.group('sep')))
+            pos = m.end()
+        out.append((text[pos:], '.'))
+        return out
+
+    def entries(self, contents, author=''):
+        """(author, title) pairs of a contents list (from the marker on)"""
+        body = self.body.match(contents, self.marker.match(contents).end())
+        if body.group('see'):
+            return []
+        text = contents[body.end():]
+        reviews = REVIEWS.search(text)
+        if reviews:
+            text = text[:reviews.start()]
+        text = ' '.join(text.split())
+        out = []
+        current = ''      # the last author named in the list
+        group = []        # entries waiting for an author after a slash
+        pieces = self.pieces(text)
+        while pieces:
+            piece, sep = pieces.pop(0)
+            piece = piece.strip(' .;,')
+            heading = self.heading.match(piece)
+            if heading and not self.lead.match(piece):
+                piece = piece[heading.end():]
+            if not piece or self.note.match(piece):
+                continue
+            own = ''
+            title, slash, who = piece.partition('/')
+            if slash:
+                who = who.strip()
+                role = self.role.match(who)
+                if role:
+                    who = who[role.end():]
+                own, end = self.format_names(who)
+                rest = who[end:].strip(' .;,')
+                if own and rest:
+                    # the next title after the names: Скворцы/Куприн А. И.
+                    pieces.insert(0, (rest, sep))
+                    sep = '.'
+                elif not own:
+                    title = piece
+            else:
+                lead = self.lead.match(piece)
+                if lead:
+                    own, title = self.format_names(lead.group('who'))[0], lead.group('title')
+                elif self.initialled.fullmatch(piece) and sep != '—':
+                    # an author heading of the entries after it
+                    current = self.format_names(piece)[0]
+                    continue
+            note = self.note.search(title)
+            if note and note.start():
+                title = title[:note.start()]
+            title = title.strip(' .;,')
+            genre = self.genre.search(title)
+            if genre and genre.start():
+                title = title[:genre.start()].strip(' .;,')
+            if not title:
+                continue
+            out.append([own, title])
+            if slash and own:
+                for i in group:
+                    out[i][0] = own
+                group = []
+            elif own:
+                current = own
+            else:
+                group.append(len(out) - 1)
+            if sep != ';':
+                for i in group:
+                    out[i][0] = current or author
+                group = []
+        for i in group:
+            out[i][0] = current or author
+        return [tuple(entry) for entry in out]
+
+    def add(self, batch, volume):
+        """Write the entries of the contents lists of a RecordBatch"""
+        rows = []
+        authors = batch.fields.get('author') or repeat(None)
+        for key, contents, author in zip(batch.key, batch.contents, authors):
+            if not contents:
+                continue
+            if author in EdgeList.tags or author == DITTO:
+                author = ''
+            author = (author or '').replace('; OTHERS', '')
+            num = item_str(key)
+            rows.extend((volume, num, i, who, title) for i, (who, title)
+                        in enumerate(self.entries(contents, author), 1))
+        self.writer.writerows(rows)
+        self.count += len(rows)
+
+
+NUMBERED_LINE = re.compile(r'\s*(?<num>[1-9][0-9]*[aаб]?)\.\s+(?<tail>.+)')
+
+
 def extract_number(line):
     """Detect if a line matches a pattern for a numbered bibliography item
     Return a tuple with a number and a text line. If a line doesn't have the
     number return zero and full line as output.
     """
-    num = re.match(r'\s*(?<num>[1-9][0-9]*[aаб]?)\.\s+(?<tail>.+)', line)
+    num = NUMBERED_LINE.match(line)
     if num:
         return (num.group('num'), num.group('tail'))
     else:
@@ -224,199 +745,1968 @@ def numbered_lines(infile):
             yield (lineno, num, tail)
 
 
-def iter_records(numlines, k=10):
+class Volume(object):
+    """A memory-mapped txt volume.
+
+    Keeps the byte offsets of all the lines, so that records, which know
+    their start and end lines, can be located in the source file and
+    their bytes viewed without copying. Use as a context manager or
+    close() when done: views into a closed volume are invalid.
+    """
+    newline = re.compile(rb"\n")
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+        self.line_starts = array('q', [0])
+        self.line_starts.extend(m.end() for m in self.newline.finditer(self.data))
+
+    def __reduce__(self):
+        return (self.__class__, (self.path,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def lines(self):
+        """Numbered lines of the volume, see mapped_lines()"""
+        return _mapped_lines(self.data)
+
+    def span(self, start, end):
+        """Byte offset and length of the lines start to end (inclusive,
+    counting from 1)
+        """
+        offset = self.line_starts[max(start, 1) - 1]
+        stop = self.line_starts[end] if end < len(self.line_starts) else len(self.data)
+        return offset, max(stop - offset, 0)
+
+    def view(self, offset, length):
+        return memoryview(self.data)[offset:offset + length]
+
+    def locate(self, records):
+        """Set offset, length and volume of the records"""
+        for rec in records:
+            rec.offset, rec.length = self.span(rec.start, rec.end)
+            rec.volume = self
+            yield rec
+
+
+def mapped_lines(path):
+    """Generator producing numbered lines as tuples, like numbered_lines(),
+    from a memory-mapped file.
+
+    Lines that may start with an item number are found with a single
+    bytes-level scan; only those are decoded one by one and checked with
+    extract_number(). The text between them is decoded in one piece and
+    yielded as a single unnumbered line (the non-empty lines joined with
+    a space, numbered by its last line), which is how iter_records()
+    would have joined them anyway. Lines that may be section headings or
+    page furniture (see standalone()) are yielded on their own.
+    """
+    with Volume(path) as volume:
+        yield from volume.lines()
+
+
+def standalone(line):
+    """Whether a line may be a section heading or page furniture, which
+    the filters after the line scanner need to see on its own
+    """
+    return line.isupper() or line.isdigit() or line.startswith(RUNNING_TITLE)
+
+
+_numbered_start = re.compile(rb"(?m)^" + BYTES_WS + rb"*[1-9]")
+_end_line = re.compile(rb"(?m)^" + BYTES_WS + rb"*#END")
+
+
+def _mapped_lines(data):
+    end = _end_line.search(data)
+    end = end.start() if end else len(data)
+    lineno = 1
+    pos = 0
+    block = []
+    blockline = 0
+    starts = [m.start() for m in _numbered_start.finditer(data, 0, end)]
+    for start in starts + [end]:
+        if start > pos:
+            lines = data[pos:start].decode('UTF-8').split('\n')
+            for i, line in enumerate(lines):
+                line = line.strip()
+                if standalone(line):
+                    if block:
+                        yield (blockline, 0, ' '.join(block))
+                        block = []
+                    yield (lineno + i, 0, line)
+                elif line:
+                    block.append(line)
+                    blockline = lineno + i
+            lineno += len(lines) - 1
+        if start == end:
+            break
+        eol = data.find(b'\n', start, end)
+        pos = end if eol == -1 else eol + 1
+        line = data[start:pos].decode('UTF-8').strip()
+        num, tail = extract_number(line)
+        if num == 0 and not standalone(line):
+            block.append(line)
+            blockline = lineno
+        else:
+            if block:
+                yield (blockline, 0, ' '.join(block))
+                block = []
+            yield (lineno, num, tail)
+        lineno += 1
+    if block:
+        yield (blockline, 0, ' '.join(block))
+
+
+class PageFurniture(object):
+    """Page furniture filter.
+
+    Drops the running heads (the first and the last author of the page,
+    ИВАНОВ А.; the running title, Детская литература 1964—1966 гг.) and
+    the page numbers from a stream of numbered lines. A bare number is
+    a page number next to a running head, or if it closely follows the
+    previous page number. A misread page number (55 for 35) moves the
+    page counter on by one only, unless the next page number confirms
+    it. One line of lookahead, counts of the dropped lines are kept in
+    the counts attribute.
+    """
+    running_head = re.compile(r"""
+    (?<name>\p{Lu}[\p{Lu}'’]+(-\p{Lu}[\p{Lu}'’]+)?\s+\p{Lu}\.?(\s*\p{Lu}\.)?)
+    (,\s*(?&name))*[,.]?                       # ГРИНВАЛЬД О., ИППО Б.
+    """, re.VERBOSE)
+    # without the years it may be the journal of the same name
+    running_title = re.compile(RUNNING_TITLE + r"\s+\d{4}\s*[—-]?\s*\d{4}\s*гг\.?")
+    max_page_step = 50
+
+    def __init__(self):
+        self.page = 0
+        self.last = 0       # the last page number as printed
+        self.counts = Counter()
+
+    def is_head(self, txt):
+        if txt.isupper():
+            return self.running_head.fullmatch(txt) is not None
+        return txt.startswith(RUNNING_TITLE) and self.running_title.fullmatch(txt) is not None
+
+    def is_page(self, n, near_head):
+        if near_head or self.page < n <= self.page + self.max_page_step:
+            if near_head or n <= self.page + 3 or 0 < n - self.last <= 3:
+                self.page = n
+            else:
+                self.page += 1
+            self.last = n
+            return True
+        return False
+
+    def strip(self, numlines):
+        after_head = False
+        pending = None      # a bare number, waiting for the next line
+        for line in numlines:
+            lineno, num, txt = line
+            head = num == 0 and self.is_head(txt)
+            if pending is not None:
+                if self.is_page(int(pending[2]), near_head or head):
+                    self.counts['page numbers'] += 1
+                else:
+                    yield pending
+                pending = None
+            if head:
+                self.counts['running heads'] += 1
+                after_head = True
+                continue
+            if num == 0 and txt.isdigit() and len(txt) <= 4:
+                pending = line
+                near_head = after_head
+            else:
+                yield line
+            after_head = False
+        if pending is not None:
+            if self.is_page(int(pending[2]), near_head):
+                self.counts['page numbers'] += 1
+            else:
+                yield pending
+
+
+_heading_number = re.compile(r"^(?:(?:[IVXІШИ]{1,4}|[1-9]|[абвгд])[.)]|[IVXІ]{1,4}|[1-9])\s+")
+_heading_hyphen = re.compile(r"(?<=\p{Lu})(?:\.|-\s+)(?=\p{Lu})")
+_heading_and = re.compile(r"(?<= )II(?= )")
+# a word printed letter-spaced: Л И Т Е Р А Т У Р А
+_heading_spaced = re.compile(r"(?<!\S)\p{Lu}(?: \p{Lu}(?!\S)){2,}")
+
+
+def heading_key(line):
+    """Normalise a heading line for the lookup in the sections table:
+    drop the section number (I., 2., а) and the final dot, close up the
+    letter-spaced words, collapse the spaces and fix the OCR errors in
+    hyphens and «И»
+    """
+    line = _heading_number.sub('', line.strip())
+    line = _heading_hyphen.sub('-', line)
+    line = _heading_spaced.sub(lambda m: m.group(0).replace(' ', ''), line)
+    return _heading_and.sub('И', ' '.join(line.split()).rstrip('.'))
+
+
+def load_headings(path):
+    """Read a sections table (key, tab, heading per line) into a dict of
+    normalised headings to section keys; also of the headings without
+    spaces, for the lines whose spaces are lost or split a word (see
+    SectionTracker.heading())
+    """
+    headings = {}
+    for line in load_names(path):
+        key, heading = line.split('\t', 1)
+        headings[heading_key(heading)] = key
+    for heading, key in list(headings.items()):
+        headings.setdefault(heading.replace(' ', ''), key)
+    return headings
+
+
+class SectionTracker(object):
+    """Sections of a volume.
+
+    strip() drops the heading lines found in the sections table from a
+    stream of numbered lines and remembers the line where every section
+    starts. label() then sets the section of the records by their start
+    line, so that it works for the records built from the stream in any
+    way (iter_records() or align_records()).
+
+    The top-level sections follow in the order of the table. A heading
+    of an earlier section after a later one (section III groups the
+    reviews like the lists: Russian literature, foreign literature...)
+    is a subsection of the current one.
+    """
+    def __init__(self, headings):
+        self.headings = headings
+        self.order = {}
+        for key in headings.values():
+            self.order.setdefault(key.split('/')[0], len(self.order))
+        self.starts = [0]
+        self.sections = ['']
+
+    def heading(self, txt, continued=False):
+        """Section key of a heading line, None if it is not a heading"""
+        if not txt.isupper():
+            return None
+        heading = heading_key(txt)
+        key = self.headings.get(heading, self.headings.get(heading.replace(' ', '')))
+        if key == '+' and not continued:
+            return None
+        return key
+
+    def strip(self, numlines):
+        continued = False
+        for lineno, num, txt in numlines:
+            key = self.heading(txt, continued)
+            continued = key is not None
+            if key is None:
+                yield (lineno, num, txt)
+            elif key == '-':
+                self.starts.append(lineno)
+                self.sections.append('')
+            elif key != '+':
+                top = self.sections[-1].split('/')[0]
+                if key.startswith('/'):
+                    key = top + key if top else key[1:]
+                elif top and self.order[key.split('/')[0]] < self.order[top]:
+                    key = top + '/' + key.split('/')[-1]
+                self.starts.append(lineno)
+                self.sections.append(key)
+
+    def section(self, lineno):
+        return self.sections[bisect_right(self.starts, lineno) - 1]
+
+    def label(self, records):
+        for rec in records:
+            # the first record of a volume starts at line 0
+            rec.section = self.section(rec.start or rec.end)
+            yield rec
+
+
+def in_sections(section, selected):
+    """Whether a section key is one of the selected sections or their
+    subsections
+    """
+    return any(section == s or section.startswith(s + '/') for s in selected)
+
+
+def known_section(section, keys):
+    """Whether a section key can be given by a sections table with these
+    keys: a top-level section, or one with a subsection of the table (a
+    subsection may come under another top-level section, see
+    SectionTracker)
+    """
+    tops = {key.split('/')[0] for key in keys if key not in ('+', '-')} - {''}
+    subsections = {key.split('/', 1)[1] for key in keys if '/' in key}
+    top, _, subsection = section.partition('/')
+    return top in tops and (not subsection or subsection in subsections)
+
+
+class Rejoiner(object):
+    """Joins the lines of a record, repairing the words broken by the
+    OCR and the hyphenation.
+
+    Soft hyphens are always removed. Other breaks are decided with a
+    lexicon of the words and hyphenated compounds of the records of
+    the volume joined so far (streaming, so it grows with the volume):
+
+    * a hyphen before a space (the end of a line): Школь- ная → Школьная,
+      unless the compound is more frequent: научно- популярная;
+    * a hyphen inside a word: Ра-чева → Рачева, if the whole word is
+      more frequent than the compound (not after one letter: Д-р);
+    * a capital letter split off a word: Ж уравли → Журавли, if the word
+      is known and the remainder is not.
+
+    Call reset() before each volume, so that a volume is joined the
+    same whichever files are processed with it. repairs counts the
+    changes by kind over all the volumes.
+    """
+    punctuation = '.,;:()[]«»"\'!?—…/*'
+    # the patterns start at the hyphen or the space, the word before it
+    # is taken by a lookbehind: much faster than scanning for words
+    soft_hyphen = re.compile(r"\xad\s*")
+    line_break = re.compile(r"(?<=(?<a>\p{L}+))-\s+(?<b>\p{Ll}+)")
+    hyphen = re.compile(r"(?<=(?<![\p{L}-])(?<a>\p{L}{2,}))-(?<b>\p{Ll}+)(?![\p{L}-])")
+    split = re.compile(r"(?<=(?<!\p{L})(?<a>\p{Lu})) (?<b>\p{Ll}{2,})")
+    compound = re.compile(r"(?<=(\p{L}+))-(\p{L}+)")
+
+    def __init__(self):
+        self.words = Counter()
+        self.compounds = Counter()
+        self.repairs = Counter()
+
+    def reset(self):
+        """Forget the lexicon learned from the previous volume"""
+        self.words.clear()
+        self.compounds.clear()
+
+    def learn(self, text):
+        text = text.lower()
+        self.words.update(map(str.strip, text.split(), repeat(self.punctuation)))
+        if '-' in text:
+            self.compounds.update(map('-'.join, self.compound.findall(text)))
+
+    def _line_break(self, m):
+        a, b = m.group('a', 'b')
+        pair = (a + '-' + b).lower()
+        if self.compounds[pair] > self.words[pair.replace('-', '')]:
+            self.repairs['compound'] += 1
+            return '-' + b
+        self.repairs['hyphenation'] += 1
+        return b
+
+    def _hyphen(self, m):
+        a, b = m.group('a', 'b')
+        pair = (a + '-' + b).lower()
+        if self.words[pair.replace('-', '')] > self.compounds[pair]:
+            self.repairs['hyphen'] += 1
+            return b
+        return m.group(0)
+
+    def _split(self, m):
+        a, b = m.group('a', 'b')
+        if self.words[(a + b).lower()] > 1 and not self.words[b]:
+            self.repairs['split'] += 1
+            return b
+        return m.group(0)
+
+    def repair(self, text):
+        if '\xad' in text:
+            text = self.soft_hyphen.sub('', text)
+        if '-' in text:
+            text = self.line_break.sub(self._line_break, text)
+            text = self.hyphen.sub(self._hyphen, text)
+        return self.split.sub(self._split, text)
+
+    def __call__(self, lines):
+        text = self.repair(' '.join(lines))
+        self.learn(text)
+        return text
+
+
+def iter_records(numlines, k=10, join=' '.join):
     """Join a series of numbered lines into a list of sequentially
 numbered items (Record instances with a defined 'num' key, tail
-attribute and start and end line numbers)
+attribute and start and end line numbers). The lines of an item are
+joined into its tail with join (see Rejoiner).
+
+Item numbers are compared as packed integer keys (see item_key()):
+12а and 12б follow 12 without a gap, 13 follows any of them.
     """
-    itemno = 0
+    itemno = 0      # key of the current item
     stack = []
     startline = 0
+    lineno = 0
     for lineno, n, txt in numlines:
-        if n == 0:
-            num = 0
-        else:
-            num = BibItem(string=n)
-        if num > itemno:
-            if num - itemno == 1:
+        key = item_key(n) if n else 0
+        if key > itemno:
+            # plain numbers skipped between the current item and this one
+            missing = range((itemno >> 2) + 1, (key >> 2) + (1 if key & 3 else 0))
+            if not missing:
                 # we have a regular next item
                 if stack:
-                    rec = Record(tail = ' '.join(stack))
-                    rec['num'] = itemno
+                    rec = Record(tail = join(stack))
+                    rec['num'] = BibItem.from_key(itemno)
                     rec.start = startline
                     rec.end = lineno - 1
                     yield rec
                     stack = []
-                    startline = lineno
+                # the first item starts here too, not at the title page
+                startline = lineno
             else:
-                if num - itemno > k:
+                if len(missing) >= k:
                     # gap in numbers is too large, unlikely to be the next
                     # number, treat as a regular textual line (with an
                     # accidental number in the beginning, like a year or
                     # a printrun figure)
-                    stack.append('{}. {}'.format(num, txt))
+                    stack.append('{}. {}'.format(item_str(key), txt))
                     continue
                 # we have a moderate gap in numbering, treat as next item
-                rec = Record(tail = ' '.join(stack))
-                rec['num'] = itemno
+                rec = Record(tail = join(stack))
+                rec['num'] = BibItem.from_key(itemno)
                 rec.start = startline
                 rec.end = lineno - 1
                 yield rec
                 stack = []
-                itemno += 1
                 startline = lineno
-                while num > itemno:
+                for m in missing:
                     rec = Record(tail = 'MISSING', start = startline, end = lineno - 1)
-                    rec['num'] = itemno
+                    rec['num'] = BibItem(m)
                     yield rec
-                    itemno += 1
-            itemno = num
+            itemno = key
             stack.append(txt)
-        elif num == 0 and itemno > 0:
+        elif key == 0 and itemno > 0:
             # non-numbered line, collect as a continuation of a curent item
             stack.append(txt)
-        elif num < itemno:
+        elif key < itemno:
             # a lesser number, not a next item, treat as an item continuation
-            stack.append('{}. {}'.format(num, txt))
-    else:
-        # end of file: yield a final record
-        rec = Record(tail = ' '.join(stack))
-        rec['num'] = str(itemno)
+            stack.append('{}. {}'.format(item_str(key), txt))
+    # end of file: yield a final record, if any item was found
+    if itemno:
+        rec = Record(tail = join(stack))
+        rec['num'] = BibItem.from_key(itemno)
         rec.start = startline
         rec.end = lineno
         yield rec
 
 
-def format_multi_authors(authors):
-    out = []
-    fmtr = ExtendedFormatter()
-    if not authors.endswith('.'):
-        authors = authors + '.'
-    for author in re.finditer(AUTHOR_NAME, authors, re.U | re.VERBOSE):
-        if author.group('real'):
-            out.append(fmtr.format("{last!c}, {ini} [{real}]", **author.groupdict()))
+def longest_increasing(keys):
+    """Return the indices of a longest strictly increasing subsequence of
+    keys in O(n log n) (patience sorting)
+    """
+    tails = []      # smallest last key of an increasing run of each length
+    tailidx = []
+    prev = [-1] * len(keys)
+    for i, key in enumerate(keys):
+        j = bisect_left(tails, key)
+        if j:
+            prev[i] = tailidx[j - 1]
+        if j == len(tails):
+            tails.append(key)
+            tailidx.append(i)
         else:
-            out.append(fmtr.format("{last!c}, {ini}", **author.groupdict()))
-    return "; ".join(out)
+            tails[j] = key
+            tailidx[j] = i
+    out = []
+    i = tailidx[-1] if tailidx else -1
+    while i >= 0:
+        out.append(i)
+        i = prev[i]
+    return out[::-1]
 
 
-def format_other_authors(others):
-    others = others.strip(' ;.,')
-    out = []
-    fmtr = ExtendedFormatter()
-    ini_author = re.compile(INI_AUTHOR, re.U | re.VERBOSE)
-    for author in re.split(r'[,;]\s+', others):
+def align_records(numlines, rejected=None, join=' '.join):
+    """Join a series of numbered lines into records like iter_records(),
+but choose the item numbers globally: of all the numbered lines in the
+volume, the longest strictly increasing sequence of numbers is taken as
+the items, so an OCR error in one number can not push the item counter
+off for the following records. The other numbered lines are treated as
+continuations. Gaps between the chosen numbers produce MISSING records.
+If rejected is a list, the (lineno, num, text) of the rejected numbered
+lines are appended to it.
+    """
+    lines = list(numlines)
+    cands = [i for i, (lineno, n, txt) in enumerate(lines) if n != 0]
+    keys = [item_key(lines[i][1]) for i in cands]
+    chosen = dict((cands[j], keys[j]) for j in longest_increasing(keys))
+    rec = None
+    prevnum = 0
+    for i, (lineno, n, txt) in enumerate(lines):
+        key = chosen.get(i)
+        if key is not None:
+            if rec is not None:
+                rec.end = lineno - 1
+                rec.tail = join(rec.tail)
+                yield rec
+            for m in range(prevnum + 1, (key >> 2) + (1 if key & 3 else 0)):
+                gap = Record(tail='MISSING', start=lineno, end=lineno - 1)
+                gap['num'] = BibItem(m)
+                yield gap
+            rec = Record(tail=[txt], start=lineno)
+            rec['num'] = BibItem.from_key(key)
+            prevnum = key >> 2
+        elif n != 0:
+            if rejected is not None:
+                rejected.append((lineno, n, txt))
+            if rec is not None:
+                rec.tail.append('{}. {}'.format(item_str(item_key(n)), txt))
+        elif rec is not None:
+            rec.tail.append(txt)
+    if rec is not None:
+        rec.end = lines[-1][0]
+        rec.tail = join(rec.tail)
+        yield rec
+
+
+def remaining(deadline):
+    """Seconds left until a time.monotonic() deadline, None if there is no
+    deadline. Raise TimeoutError when the deadline has passed.
+    """
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("regex timed out")
+    return left
+
+
+def load_names(path):
+    """Read a list of names, one per line. Blank lines and lines
+    starting with # are ignored.
+    """
+    with open(path, encoding='UTF-8') as f:
+        return [line.strip() for line in f
+                if line.strip() and not line.startswith('#')]
+
+
+class NameMatch(dict):
+    """Match-like result of a NameSet lookup"""
+    def group(self, name):
+        return self[name]
+
+    def groupdict(self):
+        return dict(self)
+
+
+class NameSet(object):
+    """A set of single-name authors matched at the start of a string.
+
+    Instead of a regex alternation over all the names, the first words
+    of the string are looked up in a hash set, so the cost of a lookup
+    depends on the number of words in the longest name, not on the
+    number of names. Behaves like a compiled pattern
+    r"(?<last>NAME)[\W\s]+(?<tail>.*)$": .match() returns an object with
+    'last' and 'tail' groups or None.
+    """
+    word = re.compile(r"\w+")
+    sep = re.compile(r"[\W\s]+")
+
+    def __init__(self, names=()):
+        self.names = frozenset(names)
+        self.maxwords = max([len(self.word.findall(n)) for n in self.names] or [0])
+
+    def match(self, string, timeout=None):
+        ends = []
+        for w in self.word.finditer(string):
+            if len(ends) == self.maxwords:
+                break
+            if ends and w.start() - ends[-1] > 1:
+                break
+            ends.append(w.end())
+        for end in reversed(ends):
+            name = string[:end]
+            if name in self.names:
+                m = self.sep.match(string, end)
+                if m:
+                    return NameMatch(last=name, tail=string[m.end():])
+        return None
+
+
+class AuthorListScanner(object):
+    """Left-to-right scanner for author lists like
+    "Антонов С., Носов Н. и Сотник Ю.".
+
+    Names are matched one at a time with the AUTHOR_NAME pattern,
+    anchored where the previous separator ended. A name, once matched,
+    is never re-entered, so a list costs one match per name and one per
+    separator. The names collected in this pass serve both the detection
+    of a multi-author record and the formatting of its authors.
+    """
+    def __init__(self):
+        self.name = re.compile(AUTHOR_NAME, re.U | re.VERBOSE)
+        self.sep = re.compile(r"\s+и\s+|,\s+")
+        self.trail = re.compile(r"[\W\s]+")
+
+    def scan(self, string, pos=0, timeout=None):
+        """Scan a list of names separated by commas or 'и' starting at pos.
+    Return a list of AUTHOR_NAME match objects, one for every name.
+    Raise TimeoutError if the whole scan takes longer than timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        names = []
+        m = self.name.match(string, pos, timeout=timeout)
+        while m:
+            names.append(m)
+            sep = self.sep.match(string, m.end())
+            if sep is None:
+                break
+            m = self.name.match(string, sep.end(), timeout=remaining(deadline))
+        return names
+
+    def match(self, string, timeout=None):
+        """Match two or more authors at the start of a string. Behaves like
+    the old multi_author pattern r"(?<all>NAME((и|,)NAME)+)[\W\s]+(?<tail>.*)$":
+    returns an object with 'all', 'tail' and 'authors' (a list of name
+    matches) groups or None.
+        """
+        names = self.scan(string, timeout=timeout)
+        while len(names) > 1:
+            end = names[-1].end()
+            trail = self.trail.match(string, end)
+            if trail:
+                return NameMatch(all=string[:end], tail=string[trail.end():],
+                                 authors=names)
+            names.pop()
+        return None
+
+
+class AuthorExtractor(object):
+    """Author name matcher with all the patterns compiled once.
+
+    An instance is reusable across records and volumes. It is also
+    picklable (the patterns are recompiled on unpickling), so it can be
+    handed over to worker processes.
+
+    With a timeout (in seconds) the matching of a record is abandoned
+    when it takes longer than that, and the record gets the ERRTIMEOUT
+    tag instead of an author.
+
+    Formatted names are kept in LRU caches of cache_size entries keyed
+    on the matched text, so an author repeated throughout a volume is
+    formatted once; see cache_info() for the hit rates.
+    """
+    def __init__(self, verbose=False, single_authors=None, timeout=None,
+                 cache_size=4096):
+        self.verbose = verbose
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.format_name = lru_cache(maxsize=cache_size)(self._format_name)
+        self.format_other_authors = lru_cache(maxsize=cache_size)(self._format_other_authors)
+        if single_authors is None:
+            single_authors = load_names(SINGLE_AUTHORS_FILE)
+        self.fmtr = ExtendedFormatter()
+        self.ini_author = re.compile(INI_AUTHOR, re.U | re.VERBOSE)
+        self.others_sep = re.compile(r'[,;]\s+')
+        self.one_author = re.compile(AUTHOR_NAME + r"([[\W\s]--[,«]]+|\s+@[[\W\s]--[«]]+)(?<tail>.*)$", re.U | re.VERBOSE | re.V1)
+        self.dash = re.compile(r"^[\W\s]*[—][\W\s]*(?<tail>.*)$", re.U)
+        self.multi_author = AuthorListScanner()
+        self.single_name_authors = NameSet(single_authors)
+        self.and_others = re.compile(AUTHOR_NAME +
+                                     r"\s+и\s+др\.\s+(?<tail>(?<head>[^/]+)" +
+                                     r"(/\s*(?<others>(" + INI_AUTHOR + r"[,;.]\s+)+))?.*)$",
+                                     re.U | re.VERBOSE)
+        self.multi_sep = re.compile(r'\s+и\s|,\s')
+        self.noauthor_tag = re.compile(r"^\s*@NOAUTHOR@[[\W\s]--[«]]+(?<tail>.*)$", re.V1)
+        self.author_tag = re.compile(r"^\s*@AUTHOR:(?<all>[^@]+)@[[\W\s]--[«]]+(?<tail>.*)$", re.V1)
+
+    def __reduce__(self):
+        return (self.__class__, (self.verbose, self.single_name_authors.names,
+                                 self.timeout, self.cache_size))
+
+    def cache_info(self):
+        """Return hits, misses and hit rate of the formatting caches"""
+        out = OrderedDict()
+        for name in ('format_name', 'format_other_authors'):
+            info = getattr(self, name).cache_info()
+            total = info.hits + info.misses
+            out[name] = {'hits': info.hits, 'misses': info.misses,
+                         'size': info.currsize,
+                         'hitrate': info.hits / total if total else 0.0}
+        return out
+
+    def _format_name(self, last, ini, real=None):
+        """Normalise a name to the 'Фамилия, И. О. [real]' form"""
+        name = self.fmtr.format("{last!c}, {ini}", last=last, ini=ini)
+        if real:
+            return "{0} [{1}]".format(name, real)
+        return name
+
+    def format_author(self, m):
+        return self.format_name(m.group('last'), m.group('ini'), m.group('real'))
+
+    def format_multi_authors(self, authors):
+        """Format a list of name matches (or a string with an author list)
+    as 'Фамилия, И. О.; Фамилия, И. О.'
+        """
+        if isinstance(authors, str):
+            # as the baseline did: the last name is matched up to a dot,
+            # and the names are searched for, not scanned
+            if not authors.endswith('.'):
+                authors = authors + '.'
+            authors = self.multi_author.name.finditer(authors)
+        return "; ".join(self.format_author(m) for m in authors)
+
+    def _format_other_authors(self, others):
+        others = others.strip(' ;.,')
+        out = []
+        for author in self.others_sep.split(others):
+            try:
+                m = self.ini_author.match(author)
+                out.append(self.format_name(m.group('last'), m.group('ini')))
+            except AttributeError:
+                raise ValueError("Unrecognized author in the others list: %s" % author)
+        return "; ".join(out)
+
+    def candidates(self, tail):
+        """Yield (name, pattern) pairs that may match the tail, in the
+    priority order of the cascade. Cheap literal checks rule out the
+    branches that can not match: author names start with a letter, the
+    dash and tag branches can not.
+        """
+        if tail[:1].isalpha():
+            if self.multi_sep.search(tail):
+                yield 'multi', self.multi_author
+            if 'др.' in tail:
+                yield 'others', self.and_others
+            yield 'one', self.one_author
+            yield 'single', self.single_name_authors
+        else:
+            if '—' in tail:
+                yield 'dash', self.dash
+            if tail.lstrip().startswith('@'):
+                yield 'noauthor', self.noauthor_tag
+                yield 'tag', self.author_tag
+
+    def extract(self, rec, prev=DITTO, verbose=None):
+        """Process numbered lines, extract author name as a separate column,
+    or indicate that it is missing with the NOAUTHOR tag. Inconsistencies
+    are marked with ERRAUTHOR tag. A '—' record takes the author from
+    prev; by default it is left with the DITTO tag to be resolved later by
+    resolve_authors(), so that records can be processed in any order.
+    Only the patterns proposed by candidates() are tried, and the first
+    one to match wins. Records that exceed the time budget are marked
+    with ERRTIMEOUT tag and keep their tail intact.
+        """
+        if verbose is None:
+            verbose = self.verbose
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
         try:
-            m = ini_author.match(author)
-            out.append(fmtr.format("{last!c}, {ini}", **m.groupdict()))
-        except AttributeError:
-            raise ValueError("Unrecognized author in the others list: %s" % author)
-    return "; ".join(out)
-    
+            for name, pattern in self.candidates(rec.tail):
+                m = pattern.match(rec.tail, timeout=remaining(deadline))
+                if m:
+                    if verbose:
+                        print("has{}:".format(name), m.groupdict())
+                    return getattr(self, '_' + name)(rec, m, prev)
+        except TimeoutError:
+            print("Timeout in item {} (lines {}-{})".format(rec.get('num'), rec.start, rec.end),
+                  file=sys.stderr)
+            rec['author'] = "ERRTIMEOUT"
+            return rec
+        rec['author'] = "NOAUTHOR"
+        return rec
 
-def extract_author(rec, prev=None, verbose=False):
-    """Process numbered lines, extract author name as a separate column,
-or indicate that it is missing with the NOAUTHOR tag. Inconsistencies
-are marked with ERRAUTHOR tag.
-    """
-    fmtr = ExtendedFormatter()   
-    one_author = re.compile(AUTHOR_NAME + r"([[\W\s]--[,«]]+|\s+@[[\W\s]--[«]]+)(?<tail>.*)$", re.U | re.VERBOSE | re.V1)
-    dash = re.compile(r"^[\W\s]*[—][\W\s]*(?<tail>.*)$", re.U)
-    multi_author = re.compile(r'(?<all>' + AUTHOR_NAME +
-                              r'((\s+и\s+|,\s+)' + AUTHOR_NAME + r')+' +
-                              r')[\W\s]+(?<tail>.*)$', re.U | re.VERBOSE)
-    single_name_authors = re.compile(r"(?<last>" + SINGLE_AUTHORS +
-                                     r")[\W\s]+(?<tail>.*)$", re.U | re.VERBOSE )
-    and_others = re.compile(AUTHOR_NAME +
-                            r"\s+и\s+др\.\s+(?<tail>(?<head>[^/]+)" +
-                            r"(/\s*(?<others>(" + INI_AUTHOR + r"[,;.]\s+)+))?.*)$",
-                            re.U | re.VERBOSE)
-    noauthor_tag = re.compile(r"^\s*@NOAUTHOR@[[\W\s]--[«]]+(?<tail>.*)$", re.V1)
-    author_tag = re.compile(r"^\s*@AUTHOR:(?<all>[^@]+)@[[\W\s]--[«]]+(?<tail>.*)$", re.V1)
-    hasone = one_author.match(rec.tail)
-    hasdash = dash.match(rec.tail)
-    hasmulti = multi_author.match(rec.tail)
-    hassingle = single_name_authors.match(rec.tail)
-    hasothers = and_others.match(rec.tail)
-    hasnoauthor = noauthor_tag.match(rec.tail)
-    hastag = author_tag.match(rec.tail)
-    if hasmulti:
-        if verbose:
-            print("hasmulti:", hasmulti.groupdict())
-        rec['author'] = format_multi_authors(hasmulti.group('all'))
-        rec.tail = hasmulti.group('tail')
-    elif hasothers:
-        if verbose:
-            print("hasothers:", hasothers.groupdict())     
-        rec['author'] = fmtr.format("{last!c}, {ini}; OTHERS", **hasothers.groupdict())
-        rec.tail = hasothers.group('tail')
-        if hasothers.group('others'):
-            others = format_other_authors(hasothers.group('others'))
+    def _multi(self, rec, m, prev):
+        rec['author'] = self.format_multi_authors(m.group('authors'))
+        rec.tail = m.group('tail')
+        return rec
+
+    def _others(self, rec, m, prev):
+        rec['author'] = self.format_name(m.group('last'), m.group('ini')) + "; OTHERS"
+        rec.tail = m.group('tail')
+        if m.group('others'):
+            others = self.format_other_authors(m.group('others'))
             if others:
                 rec['author'] = others
-    elif hasone:
-        if verbose:
-            print("hasone:", hasone.groupdict())
-        rec['author'] = fmtr.format("{last!c}, {ini}", **hasone.groupdict())
-        if hasone.group('real'):
-            rec['author'] = "{0} [{1}]".format(rec['author'], hasone.group('real'))
-        rec.tail = hasone.group('tail')
-    elif hasdash:
-        if prev is None:
-            rec['author'] = "ERRAUTHOR"
-        elif prev == "NOAUTHOR":
-            rec['author'] = "ERRAUTHOR"
-        else:
-            rec['author'] = prev
-        rec.tail = hasdash.group('tail')
-    elif hassingle:
-        if hassingle.group('last').isupper():
-            autr = hassingle.group('last').capitalize()
+        return rec
+
+    def _one(self, rec, m, prev):
+        rec['author'] = self.format_author(m)
+        rec.tail = m.group('tail')
+        return rec
+
+    def _dash(self, rec, m, prev):
+        rec['author'] = DITTO
+        rec.tail = m.group('tail')
+        if prev != DITTO:
+            resolve_ditto(rec, prev)
+        return rec
+
+    def _single(self, rec, m, prev):
+        if m.group('last').isupper():
+            autr = m.group('last').capitalize()
         else:
-            autr = hassingle.group('last')
+            autr = m.group('last')
         rec['author'] = autr
-        rec.tail = hassingle.group('tail')
-    elif hasnoauthor:
+        rec.tail = m.group('tail')
+        return rec
+
+    def _noauthor(self, rec, m, prev):
         rec['author'] = "NOAUTHOR"
-        rec.tail = hasnoauthor.group('tail')
-    elif hastag:
-        rec['author'] = hastag.group('all')
-        rec.tail = hastag.group('tail')
+        rec.tail = m.group('tail')
+        return rec
+
+    def _tag(self, rec, m, prev):
+        rec['author'] = m.group('all')
+        rec.tail = m.group('tail')
+        return rec
+
+    __call__ = extract
+
+
+_default_extractor = None
+
+
+def default_extractor():
+    """Return a shared AuthorExtractor instance (compiled on first use)"""
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = AuthorExtractor()
+    return _default_extractor
+
+
+def format_multi_authors(authors):
+    return default_extractor().format_multi_authors(authors)
+
+
+def format_other_authors(others):
+    return default_extractor().format_other_authors(others)
+
+
+def resolve_ditto(rec, prev):
+    """Replace the DITTO tag of a record with the previous author"""
+    if prev is None:
+        rec['author'] = "ERRAUTHOR"
+    elif prev in ("NOAUTHOR", "ERRTIMEOUT"):
+        rec['author'] = "ERRAUTHOR"
     else:
-        rec['author'] = "NOAUTHOR"
-    return rec
+        rec['author'] = prev
+
+
+def resolve_authors(records):
+    """Fill DITTO authors forward from the previous record (sequential)"""
+    prev = None
+    section = None
+    for rec in records:
+        if rec.section != section:
+            # '—' does not refer across a section heading
+            prev = None
+            section = rec.section
+        if rec['author'] == DITTO:
+            resolve_ditto(rec, prev)
+        prev = rec['author']
+        yield rec
+
+
+_worker_extractor = None
+_worker_fields = None
+
+
+def _init_worker(extractor, fields=None):
+    global _worker_extractor, _worker_fields
+    _worker_extractor = extractor
+    _worker_fields = fields
+
+
+def _extract_worker(rec):
+    rec = _worker_extractor.extract(rec)
+    return _worker_fields(rec) if _worker_fields else rec
+
+
+def extract_authors(records, extractor, jobs=1, chunksize=256, fields=None):
+    """Run the author extraction (and the FieldExtractor fields, if
+    given) over records, in jobs worker processes if jobs > 1. Records
+    come out in the input order, with '—' records resolved.
+    """
+    if jobs > 1:
+        with multiprocessing.Pool(jobs, _init_worker, (extractor, fields)) as pool:
+            yield from resolve_authors(pool.imap(_extract_worker, records, chunksize))
+    elif fields:
+        yield from resolve_authors(fields(extractor.extract(rec)) for rec in records)
+    else:
+        yield from resolve_authors(extractor.extract(rec) for rec in records)
+
+
+def extract_author(rec, prev=None, verbose=False):
+    """Process numbered lines, extract author name as a separate column,
+or indicate that it is missing with the NOAUTHOR tag. Inconsistencies
+are marked with ERRAUTHOR tag. A convenience wrapper around a shared
+AuthorExtractor.
+    """
+    return default_extractor().extract(rec, prev, verbose=verbose)
+
+
+GENRE = r"""(?:Повест|Рассказ|Роман|Стих|Сказ|Пьес|Очерк|Поэм|Басн|Песн|Песен|
+    Былин|Новелл|Загадк|Комеди|Драм|Хроник|Легенд|Сценари|Книжка-|Альбом)\p{L}*"""
+
+ILLUSTRATOR_NAME = r"(?:\p{Lu}\.\s?){1,2}\s?\p{Lu}\p{Ll}*(?:[-’']\p{Lu}?\p{Ll}+)*"
+# genitive endings of the surnames after Рис., Илл., Оформл. (Рис. Ю.
+# Реброва, Т. Мавриной) and their nominative ones; -а is dropped after a
+# consonant only
+GENITIVE_ENDINGS = (('ского', 'ский'), ('цкого', 'цкий'), ('ской', 'ская'),
+                    ('цкой', 'цкая'), ('ой', 'а'), ('а', ''))
+
+# a city (Ростов н/Д.) or abbreviated cities joined with a dash (М.—Л.)
+PLACE = r"""(?:\p{Lu}\p{Ll}{0,3}[.,]?[—-]\s?\p{Lu}\p{Ll}{0,3}\.
+    |\p{Lu}[\p{Ll}-]*(?:-\p{Lu}\p{Ll}+)*\.?(?:\s?н/Д\.?)?)"""
+
+
+class FieldExtractor(object):
+    """Bibliographic fields of the description (the tail left after the
+    author): title, genre, illustrator, place, publisher, year, series,
+    pages, printrun, price and age group.
+
+    One left-to-right pass over the tail. The title and the genre are
+    matched at the start. The imprint (Place, Publisher, Year) is then
+    searched for by its year, and splits the rest: the text before it
+    is tokenised with the scanner pattern (an alternative, a named
+    group, per kind of token); the fields after it (series, pages,
+    printrun, price, age group) follow one another, so they are taken
+    with a single anchored match of the chain pattern, and the text
+    after them is only scanned if the chain broke off early. A
+    description without an imprint is tokenised with the scanner.
+
+    Each field takes the first token of its kind (the illustrators
+    collect all theirs); a parenthesised token is the genre before the
+    imprint and the series after it. The scan stops at the contents
+    (Содерж.:) and the reviews (Рец.:). Fields that are not found are
+    empty strings; the values keep the text of the description, with
+    spaces normalised (printruns as plain digits), except for the
+    illustrators: their names are put in the nominative and in the form
+    of the author column, 'Ребров, Ю.; Житников, В.' (see EdgeList).
+    """
+    fields = DESCRIPTION_FIELDS
+    # the description proper is short: do not scan long contents lists
+    max_scan = 2000
+
+    def __init__(self):
+        # the genre runs to the end of its sentence: a dot goes on before
+        # a lower-case word or a number (Пьеса в 2-х д., 4-х карт.), in a
+        # compound (ген.-лейт.) and after an initial; a comma before the
+        # place ends it (Повесть, М., 1925), and it never takes a year, the
+        # illustrators or the age group (Повесть Рис. А. Дронова М., 1963)
+        notes = r"(?:(?:Рис|Илл|Иллюстр|Худож|Оформл)\.|Для\s)"
+        genre = GENRE + r"""(?:(?!(?<![\d\p{L}])(?:1[89]\d\d(?!\d)|""" + notes + r"""))
+            (?:[^.:,(){}/\[]|,(?!\s*\p{Lu}\p{Ll}{0,3}[.,])
+            |[.:](?=,?\s*(?:\p{Ll}|\d(?!\d{3}))|-\p{Ll})|(?<=(?<!\p{L})\p{Lu})\.)){0,120}+"""
+        self.head = re.compile(r"""
+        \s*(?<title>(?:«[^»]{0,300}»|\.{2,}|[^.:(]|[.:](?=\S))*?)\s*
+        (?:[.:](?:\s+|$)|$|(?=\())
+        (?:[({](?<genre>""" + genre + r""")[.:]*[)}]['’]?\.?(?:\s+|$)
+          |[({]?(?<genre>""" + genre + r""")[.:,]*['’]?
+           (?:\s+|$|(?=[/({\[—–])|(?<=\s)(?=""" + notes + r""")))?
+        """, re.VERBOSE)
+        self.genre = re.compile(GENRE, re.VERBOSE)
+        # the year first: a literal digit is found fast, the place and
+        # the publisher are matched behind it
+        self.imprint = re.compile(r"""
+        (?<year>1[89]\d\d)(?!\d)
+        (?<=(?:^|[.)»—\]/])\s*(?<place>""" + PLACE + r""")\s*[,:]\s*
+            (?:(?<publisher>(?:[^,;:()«»\d.]|\.(?!\s*\p{Lu})){0,40}?«[^»]{1,80}»|[^,;:()«»\d]{1,60}?)\s*,\s*)?1[89]\d\d)
+        """, re.VERBOSE)
+        tokens = {
+            'stop': r"""(?<!\p{L})С\s?о\s?д\s?е\s?р\s?ж\s?(?:\.|ание)|""" + REVIEWS.pattern,
+            'illustrator': r"""(?<!\p{L})(?<role>Рис|Рисунки|Илл|Иллюстр|Иллюстрации|Худож|
+                Художник|Художники|Оформл|Оформление)\.?(?:\s+и\s+(?:оформл|рис)\p{L}*\.?)?\s*
+                (?<who>""" + ILLUSTRATOR_NAME + r"""(?:(?:,\s*|\s+и\s+)""" + ILLUSTRATOR_NAME + r""")*)""",
+            'age': r"""[({]?(?<!\p{L})Для\s(?<agetext>[^()/]{0,80}?(?:возр|школ|детей|класс)\p{L}*)
+                (?=\.?\s*[)/]|\.?\s*$|\.\s+\p{Lu})\.?\)?
+                |\((?<agetext2>(?:Дошк|Мл|Ср|Ст)\p{L}*\.?\s[^()]{0,40}?возр\p{L}*)\.?\)""",
+            'paren': r"""\((?<inner>[^()]{2,200})\)""",
+            'pages': r"""(?<![\d\p{L}])(?:(?<npages>\d+)\s*(?:стр|с)\.|[Сс]тр\.\s*(?<npages2>\d+))""",
+            'printrun': r"""(?<![\d\p{L}])(?:(?<copies>\d[\d\sОOоo]*?)\s*(?:\([^()]{0,40}\)\s*)?экз\b\.?
+                |(?<!\p{L})[Тт]\.\s*(?<copies2>\d[\d\sОO]*\d|\d))""",
+            'price': r"""(?<![\d\p{L}])(?:[Цц]\.\s*)?(?<cost>(?:\d+\s*р[.\\]\s*)?\d+\s*к\.
+                |\d+\s*р\.)(?:,\s*пер\.\s*(?:\d+\s*р\.\s*)?(?:\d+\s*к\.)?)?""",
+            'anyyear': r"""(?<![\d\p{L}-])1[89]\d\d(?![\d\p{L}-])""",
+        }
+        order = ('stop', 'illustrator', 'imprint', 'age', 'paren', 'pages',
+                 'printrun', 'price', 'anyyear')
+        tokens['imprint'] = r"""(?<=(?:^|[.)»—\]/])\s*)(?<place>""" + PLACE + r""")\s*[,:]\s*
+            (?:(?<publisher>(?:[^,;:()«»\d.]|\.(?!\s*\p{Lu})){0,40}?«[^»]{1,80}»|[^,;:()«»\d]{1,60}?)\s*,\s*)?(?<year>1[89]\d\d)(?!\d)"""
+        self.scanner = re.compile('|'.join(
+            '(?<{}>{})'.format(kind, tokens[kind]) for kind in order), re.VERBOSE)
+        # the fields after the imprint; the values are read from the
+        # captures of the groups of their kind
+        self.chaining = {kind: re.findall(r"\(\?<(\w+)>", tokens[kind])
+                         for kind in ('age', 'paren', 'pages', 'printrun', 'price')}
+        self.chain = re.compile(r"(?:[\s.,;:—–-]*(?:" + '|'.join(
+            '(?<{}>{})'.format(kind, tokens[kind])
+            for kind in self.chaining) + r"))*", re.VERBOSE)
+        self.stop = re.compile(tokens['stop'], re.VERBOSE)
+        self.illustrator = re.compile(r"(?<ini>(?:\p{Lu}\.\s?){1,2})\s?(?<last>\p{Lu}[^\s,;.]*)")
+        self.zeros = str.maketrans('ОOоo', '0000', ' \t\n')
+
+    def __reduce__(self):
+        return (self.__class__, ())
+
+    @staticmethod
+    def clean(text):
+        return ' '.join(text.split())
+
+    def illustrators(self, who, genitive=False):
+        """The names of an illustrator token as 'Фамилия, И. О.', put in
+        the nominative if the token has them in the genitive
+        """
+        names = []
+        for m in self.illustrator.finditer(who):
+            last = m.group('last')
+            if genitive:
+                for ending, nominative in GENITIVE_ENDINGS:
+                    if (last.endswith(ending) and len(last) > len(ending) + 1
+                            and (ending != 'а' or last[-2] not in 'аеёиоуыэюяьй')):
+                        last = last[:-len(ending)] + nominative
+                        break
+            names.append("{}, {}".format(last, ' '.join(re.findall(r"\p{Lu}\.", m.group('ini')))))
+        return names
+
+    def take(self, kind, group, values, after_imprint):
+        """Store the value of a token (group returns the text of its
+        groups by name), if its field is still empty. Return False at
+        the end of the description.
+        """
+        if kind == 'stop':
+            return False
+        elif kind == 'illustrator':
+            for name in self.illustrators(group('who'), not group('role').startswith('Худож')):
+                if name not in values['illustrator']:
+                    values['illustrator'].append(name)
+        elif kind == 'imprint':
+            if not values['year'] or not values['place']:
+                values['place'] = self.clean(group('place'))
+                values['publisher'] = self.clean(group('publisher') or '')
+                values['year'] = group('year')
+        elif kind == 'paren':
+            inner = self.clean(group('inner'))
+            if after_imprint:
+                if not values['series']:
+                    values['series'] = inner
+            elif not values['genre'] and self.genre.match(inner):
+                values['genre'] = inner
+        elif kind == 'anyyear':
+            if not values['year']:
+                values['year'] = group('anyyear')
+        elif not values[kind]:
+            if kind == 'pages':
+                values[kind] = group('npages') or group('npages2')
+            elif kind == 'printrun':
+                values[kind] = (group('copies') or group('copies2')).translate(self.zeros)
+            elif kind == 'age':
+                values[kind] = self.clean(group('agetext') or group('agetext2'))
+            elif kind == 'price':
+                values[kind] = self.clean(group('cost'))
+        return True
+
+    def scan(self, tail, pos, end, values, after_imprint):
+        """Tokenise tail[pos:end] with the scanner"""
+        for t in self.scanner.finditer(tail, pos, end):
+            if not self.take(t.lastgroup, t.group, values, after_imprint):
+                return False
+        return True
+
+    def extract(self, rec):
+        """Fill the description fields of a record"""
+        tail = rec.tail
+        values = dict.fromkeys(self.fields, '')
+        if tail == 'MISSING':
+            # a placeholder of a missing item has no description
+            for name, value in values.items():
+                setattr(rec, name, value)
+            return rec
+        values['illustrator'] = []
+        m = self.head.match(tail)
+        values['title'] = self.clean(m.group('title'))
+        if m.group('genre'):
+            values['genre'] = self.clean(m.group('genre'))
+        pos = m.end()
+        # the imprint of the record, not of a review
+        stop = self.stop.search(tail, pos)
+        imprint = self.imprint.search(tail, pos, stop.start() if stop else len(tail))
+        if imprint is None:
+            self.scan(tail, pos, pos + self.max_scan, values, False)
+        elif (self.scan(tail, pos, imprint.start('place'), values, False)
+              and not self.stop.match(tail, imprint.start('place'))):
+            self.take('imprint', imprint.group, values, True)
+            chain = self.chain.match(tail, imprint.end())
+            for kind, names in self.chaining.items():
+                spans = chain.spans(kind)
+                if spans:
+                    # the groups of the first token of the kind
+                    end = spans[0][1]
+                    groups = {}
+                    for name in names:
+                        for s, e in chain.spans(name)[:1]:
+                            if e <= end:
+                                groups[name] = tail[s:e]
+                    self.take(kind, groups.get, values, True)
+            # the chain was broken (by an OCR error or an inserted note)
+            # before the fields it usually has
+            if not (values['pages'] and values['printrun'] and values['price']):
+                pos = chain.end()
+                self.scan(tail, pos, pos + self.max_scan, values, True)
+        values['illustrator'] = '; '.join(values['illustrator'])
+        for name, value in values.items():
+            setattr(rec, name, value)
+        return rec
+
+    __call__ = extract
+
+
+def join_tails(tails):
+    """The tails of a batch as one text, joined with newlines (no token
+    spans them), the end offsets of the tails in it (the tail of a match
+    is bisect_right(ends, m.start())) and the offsets where the reviews
+    of the tails start, by tail
+    """
+    ends = []
+    pos = 0
+    for tail in tails:
+        pos += len(tail) + 1
+        ends.append(pos)
+    text = '\n'.join(tails)
+    stops = {}
+    for m in REVIEWS.finditer(text):
+        stops.setdefault(bisect_right(ends, m.start()), m.start())
+    return text, ends, stops
+
+
+class PrintrunParser(object):
+    """Printruns as integers, parsed over a column of tails at once (see
+    RecordBatch.numbers): printrun_total, the copies printed; print_from
+    and print_to, the copy numbers of a cumulative range, «115 000 (1—90
+    тыс.) экз.» → 115000, 1, 90000 (the range is counted in whole
+    thousands: «26—50 тыс.» are the copies 25001 to 50000); and
+    printrun_ambiguous, 1 if the number needs a look: OCR letters in the
+    digits, irregular groups of digits (100 00), a range that does not
+    fit the total, or several different printruns in one record. Missing
+    numbers are -1.
+
+    The printrun is «N экз.» (or «N тыс. экз.»), a bare range «101—200
+    тыс.», or, in the 1920s and 30s, «Стр. 24. Т. 15 000.»; the latter
+    (Т. is also a volume) is only used if there is no other.
+
+    The columns replace the printrun of FieldExtractor, the text as
+    printed, which stops at OCR letters in the digits: «т. 50 ооО» → 50.
+    """
+    fields = ('printrun_total', 'print_from', 'print_to', 'printrun_ambiguous')
+    # the fields of FieldExtractor not written with these columns
+    replaces = ('printrun',)
+
+    def __init__(self):
+        # the tails of a batch are joined with newlines: no token spans
+        # them. Every pattern starts with a literal, which the regex
+        # engine finds fast, and matches the number behind it
+        number = r"""(?:\d{1,3}[.,](?=\d{3}))?\d[\dОOоoЗ]*
+            (?:(?:[*'’]?[^\S\n]{1,2}|['’])[\dОOоoЗ]+)*"""
+        cumulative = r"""(?:[(<{][^\S\n]*(?:
+                (?:\d+-?й[^\S\n]+завод[^\S\n]*[—–-]?[^\S\n]*)?
+                (?:(?<rfrom>\d+|I)[^\S\n]*[—–-]+[^\S\n]*)?
+                (?<rto>\d+(?:,\d)?(?:[^\S\n]\d{3})*)[^\S\n]*(?:(?<rk>тыс)\b\.?)?
+            |[^()\n]{0,40}?)[^\S\n]*[)>}][^\S\n]*)?"""
+        # 300 000 экз., 30 тыс. экз., 115 000 (1—90 тыс.) экз.
+        self.copies = re.compile(r"""(?<=(?<![\d\p{L}])(?<!\d[^\S\n]*[—–-]+[^\S\n]*)
+            (?<total>""" + number + r""")[^\S\n]*(?:(?<k>тыс)\b\.?[^\S\n]*)?""" +
+            cumulative + r"""[эз])кз\b""", re.VERBOSE)
+        # 101—200 тыс.
+        self.range = re.compile(r"""(?<=(?<![\d\p{L}])(?<rfrom>\d+|I)[^\S\n]*[—–-]+[^\S\n]*
+            (?<rto>\d+(?:,\d)?)[^\S\n]*)(?<rk>тыс)\b""", re.VERBOSE)
+        # Стр. 24. Т. 15 000.; a pattern per letter, to keep the literal
+        self.volumes = [re.compile(letter + r"""\.(?<=[^\p{L}\s][^\S\n]*.\.)
+            [^\S\n]*(?<volume>""" + number + r""")(?:[.,]?[^\S\n]*""" + cumulative + r""")?""",
+            re.VERBOSE) for letter in 'Тт']
+        self.digits = str.maketrans('ОOоoЗ', '00003', " \t'’*.,")
+        self.groups = re.compile(r"[1-9]\d{0,2}(?:[ '’.,]\d{3})*|[1-9]\d*")
+
+    def number(self, text):
+        """The value of a printed number and whether it is plain"""
+        digits = text.translate(self.digits)
+        return int(digits), self.groups.fullmatch(text) is not None
+
+    def range_of(self, m):
+        """Copy numbers of the cumulative range of a match (-1 if none)
+        and whether they are plain
+        """
+        rto = m.group('rto')
+        if rto is None:
+            return -1, -1, True
+        plain = True
+        thousands = m.group('rk') and rto.replace(',', '').isdigit()
+        if thousands:
+            to = int(round(float(rto.replace(',', '.')) * 1000))
+        else:
+            to, plain = self.number(rto)
+            plain = plain and not m.group('rk')
+        rfrom = m.group('rfrom')
+        if rfrom is None:
+            return -1, to, plain
+        start = 1 if rfrom == 'I' else int(rfrom)
+        if thousands:
+            start = (start - 1) * 1000 + 1
+        return start, to, plain and rfrom != 'I' and start <= to
+
+    def parse(self, tails):
+        """The printrun columns (arrays) of a list of tails"""
+        n = len(tails)
+        total = array('q', [-1]) * n
+        start = array('q', [-1]) * n
+        end = array('q', [-1]) * n
+        ambiguous = array('q', [0]) * n
+        text, ends, _ = join_tails(tails)
+        # the copies and the ranges in the order of the text (of their
+        # first group, the number before the literal), then the Т. numbers
+        hits = sorted(chain(self.copies.finditer(text), self.range.finditer(text)),
+                      key=lambda m: m.start(1))
+        hits += chain.from_iterable(volume.finditer(text) for volume in self.volumes)
+        weak = set()     # taken from a Т. number
+        ranged = set()   # a range alone, until a total is found
+        for m in hits:
+            i = bisect_right(ends, m.start())
+            rfrom, rto, plain = self.range_of(m)
+            if m.re is self.range:
+                # a range alone is the printrun, after a total it is
+                # the range of the total
+                if total[i] < 0:
+                    total[i], start[i], end[i] = rto - rfrom + 1, rfrom, rto
+                    ambiguous[i] = not plain
+                    ranged.add(i)
+                elif start[i] < 0:
+                    start[i], end[i] = rfrom, rto
+                    ambiguous[i] |= not plain or rto - rfrom >= total[i]
+                continue
+            if m.re is self.copies:
+                value, ok = self.number(m.group('total'))
+                if m.group('k'):
+                    value *= 1000
+            else:
+                if total[i] >= 0 and i not in weak and i not in ranged:
+                    continue
+                value, ok = self.number(m.group('volume'))
+                if value < 100:
+                    continue
+                weak.add(i)
+            if value <= 0:
+                # a stray fragment of a number (000 экз.)
+                ambiguous[i] = 1
+            elif total[i] < 0 or i in ranged:
+                if i in ranged and rto < 0:
+                    rfrom, rto, plain = start[i], end[i], not ambiguous[i]
+                ranged.discard(i)
+                total[i], start[i], end[i] = value, rfrom, rto
+                ambiguous[i] = (not (plain and ok) or value >= 10**7
+                                or rto - max(rfrom, 1) >= value)
+            elif value != total[i]:
+                ambiguous[i] = 1
+        return OrderedDict(zip(self.fields, (total, start, end, ambiguous)))
+
+    def __call__(self, batch):
+        """Add the printrun columns to a RecordBatch"""
+        batch.numbers.update(self.parse(batch.tail))
+        return batch
+
+
+class PriceParser(object):
+    """Page counts and prices as integers, parsed over a column of tails at
+    once (see RecordBatch.numbers): pages, «Стр. 38», «173 стр.» or «175
+    с.»; plates, the leaves of illustrations outside the pages («и 4 л.
+    илл.», added up); price_kop, the price in kopecks as printed («3 р. 80
+    к.» → 380, «Б. ц.» → 0); and price_1961_kop, the price in the rubles
+    of the 1961 redenomination. Missing numbers are -1. The first pages
+    and price of a record are taken, not those of the reviews.
+
+    The prices of the volumes up to 1958—1960 are in the old rubles (that
+    volume prints them «в ценах до 1 января 1961 г.»): they are divided
+    by 10, rounded half up. The prices of before 1924 are in the money
+    of those years and are only comparable among themselves.
+
+    The columns replace the pages and the price of FieldExtractor.
+    """
+    fields = ('pages', 'plates', 'price_kop', 'price_1961_kop')
+    replaces = ('pages', 'price')
+    redenomination = 1961
+
+    def __init__(self):
+        # Every pattern starts with a literal and looks back at the
+        # number before it (see PrintrunParser); the alternatives are
+        # separate patterns, which keeps the literals and runs twice as
+        # fast, and the first match of a record in the text wins
+        before = r"(?<=(?<![\d\p{L}])(?<%s>\d+)[^\S\n]*)"
+        # a range of pages is an article: «с. 27—44»
+        range_ = r"(?![^\S\n]*\d+[^\S\n]*[—–-]+[^\S\n]*\d)"
+        # prices of the early 1920s run into thousands of rubles (1 500 р.)
+        grouped = r"(?<=(?<![\d\p{L}])(?<%s>\d{1,3}(?:[ ]\d{3})+|\d+)[^\S\n]*)"
+        # 173 стр., 175 с., also run into the year (1955120 стр.); Стр. 38
+        self.pages = [re.compile(r"(?<=(?<![\d\p{L}])(?:1[89]\d\d)?(?<n>\d{1,4})[^\S\n]*)"
+                                 r"(?:стр\b|с\.)" + range_),
+                      re.compile(r"(?<!\p{L})Стр\b\.?" + range_ + r"[^\S\n]*(?<n>\d{1,4})(?!\d)")]
+        self.plates = re.compile(before % 'n' + r"л\.[^\S\n]*"
+                                 r"(?:ил|портр|карт|табл|цв|черт|схем|нот|фот)")
+        # 3 р. 80 к., 11 р., 25 к., 15 к 4 000 000 экз.; Б. ц., Беспл.
+        self.prices = [re.compile(grouped % 'r' + r"р(?:уб)?\b[.,-]?"
+                                  r"(?:[^\S\n]*(?<k>\d+)[^\S\n]*к(?:оп)?\b\.?)?"),
+                       re.compile(before % 'k' + r"к(?:оп)?(?:\.|\b(?=[^\S\n]*(?:[\d(,;—–\n-]|\Z)))"),
+                       re.compile(r"(?<!\p{L})(?<free>Б\.[^\S\n]*ц\b|Беспл)")]
+
+    @staticmethod
+    def number(text):
+        return int(text.replace(' ', ''))
+
+    def kopecks(self, m):
+        """The price of a match in kopecks"""
+        groups = m.groupdict()
+        if groups.get('free'):
+            return 0
+        rubles = self.number(groups['r']) if groups.get('r') else 0
+        return rubles * 100 + (int(groups['k']) if groups.get('k') else 0)
+
+    @staticmethod
+    def first(patterns, text, ends, stops, value):
+        """An array of the value of the first match of the patterns in each
+        record before its reviews (-1 if none)
+        """
+        values = array('q', [-1]) * len(ends)
+        at = stops.copy()
+        for m in chain.from_iterable(pattern.finditer(text) for pattern in patterns):
+            i = bisect_right(ends, m.start())
+            if m.start() < at.get(i, len(text)):
+                at[i] = m.start()
+                values[i] = value(m)
+        return values
+
+    def parse(self, tails, volume=None):
+        """The page and price columns (arrays) of a list of tails of a
+        volume (its name, to tell the old rubles from the new)
+        """
+        n = len(tails)
+        plates = array('q', [-1]) * n
+        text, ends, stops = join_tails(tails)
+        pages = self.first(self.pages, text, ends, stops, lambda m: int(m.group('n')))
+        for m in self.plates.finditer(text):
+            i = bisect_right(ends, m.start())
+            if m.start() < stops.get(i, len(text)):
+                plates[i] = max(plates[i], 0) + int(m.group('n'))
+        price = self.first(self.prices, text, ends, stops, self.kopecks)
+        period = volume_period(volume) if volume else None
+        if period is None:
+            new = array('q', [-1]) * n
+        elif period[1] < self.redenomination:
+            new = array('q', ((v + 5) // 10 if v > 0 else v for v in price))
+        else:
+            new = array('q', price)
+        return OrderedDict(zip(self.fields, (pages, plates, price, new)))
+
+    def __call__(self, batch, volume=None):
+        """Add the page and price columns to a RecordBatch of a volume"""
+        batch.numbers.update(self.parse(batch.tail, volume))
+        return batch
+
+
+class YearParser(object):
+    """Years of publication as integers, parsed over a column of tails at
+    once (see RecordBatch.numbers): year, and year_out_of_range, 1 if the
+    year is not in the period of the volume (1958-1960.txt: 1958 to
+    1960), a late entry or a misreading to check. Missing years are -1.
+
+    The candidates are the years of 1800—1999 before the reviews, also
+    misread («I960», «1.960») or run into the pages («1955120 стр.»);
+    the imprint year follows a comma, colon or dash («М., Детгиз,
+    1960.», «— 1982.») or starts the tail («То же. 1963.»). The period
+    of the volume is the prior: the first imprint year in the period
+    wins, then any year in the period (the item and page numbers are
+    rarely in it), then the first imprint year.
+
+    The columns replace the year of FieldExtractor, the year of the
+    first imprint it recognises (no prior, no misreadings).
+    """
+    fields = ('year', 'year_out_of_range')
+    replaces = ('year',)
+
+    def __init__(self):
+        self.years = re.compile(r"""(?<![\d\p{L}])(?<!(?<![,:][^\S\n]*)\.)
+            (?:(?<=(?:[,:—–-]|^|\n|То[^\S\n]*же\.?)[^\S\n]*\.?)(?<imprint>))?
+            (?<year>[1Iil]\.?[89]\d\d)(?:(?!\d)|(?=\d{1,4}[^\S\n]*(?:стр|с\.)))""",
+            re.VERBOSE)
+        self.digits = str.maketrans('Iil', '111', '.')
+
+    def parse(self, tails, volume=None):
+        """The year columns (arrays) of a list of tails of a volume (its
+        name, for the period)
+        """
+        n = len(tails)
+        year = array('q', [-1]) * n
+        out = array('q', [0]) * n
+        text, ends, stops = join_tails(tails)
+        period = volume_period(volume) if volume else None
+        first, last = period or (0, 9999)
+        # the candidates of a record, best first: (tier, position, year)
+        best = {}
+        for m in self.years.finditer(text):
+            i = bisect_right(ends, m.start())
+            if m.start() >= stops.get(i, len(text)):
+                continue
+            value = int(m.group('year').translate(self.digits))
+            inside = first <= value <= last
+            imprint = m.group('imprint') is not None
+            if inside or imprint:
+                tier = 0 if inside and imprint else 1 if inside else 2
+                best[i] = min(best.get(i, (3,)), (tier, m.start(), value))
+        for i, (tier, _, value) in best.items():
+            year[i] = value
+            out[i] = tier == 2
+        return OrderedDict(zip(self.fields, (year, out)))
+
+    def __call__(self, batch, volume=None):
+        """Add the year columns to a RecordBatch of a volume"""
+        batch.numbers.update(self.parse(batch.tail, volume))
+        return batch
+
+
+def load_age_groups(path):
+    """Read an age groups table (flag, tab, phrase per line) into a list of
+    (flag, phrase) pairs
+    """
+    return [tuple(line.split('\t', 1)) for line in load_names(path)]
+
+
+class PhraseAutomaton(object):
+    """Phrases of a table compiled into a single pattern: the phrases into a
+    trie of letters, the trie into nested alternatives, which the regex
+    engine runs as an automaton over a text, once: at every node it only
+    tries the next letters, so the time hardly grows with the number of
+    phrases (see benchmark.py gazetteer). Every lower-case letter
+    matches both cases and its Latin look-alike, an upper-case one only
+    itself and its look-alike; an abbreviation matches its OCR variants
+    (сред. сред, сред).
+
+    A subclass may tell the phrases apart at their ends, see ends().
+    """
+    # Latin letters read by OCR for the Cyrillic ones
+    lookalikes = {'а': 'aA', 'в': 'B', 'е': 'eE', 'к': 'kK', 'м': 'M',
+                  'н': 'H', 'о': 'oO', 'р': 'pP', 'с': 'cC', 'т': 'T',
+                  'у': 'yY', 'х': 'xX'}
+    # between the words, within a tail
+    space = r"[^\S\n]*"
+    # the end of a word by its last character in the table: a prefix
+    # (младш*, also cut short: младш.), an abbreviation (мл.) or a whole
+    # word
+    endings = {'*': r"\p{L}*+[.,]?", '.': r"(?!\p{L})[.,]?", '': r"(?!\p{L})"}
+
+    @staticmethod
+    def split(word):
+        """The letters of a word of the table and its ending"""
+        if word[-1] in '*.':
+            return word[:-1], word[-1]
+        return word, ''
+
+    def trie(self, phrases):
+        """Trie of the letters of (words, end) pairs: a key per letter, an
+        (ending,) key at the end of a word and a (' ',) key between the
+        words; the ends of the phrases stopping at a node are listed
+        under None
+        """
+        root = {}
+        for words, end in phrases:
+            node = root
+            for k, word in enumerate(words):
+                letters, ending = self.split(word)
+                keys = [(' ',)] * bool(k) + list(letters) + [(ending,)]
+                for key in keys:
+                    node = node.setdefault(key, {})
+            node.setdefault(None, []).append(end)
+        return root
+
+    def variants(self, c):
+        """The characters a letter of the table matches"""
+        similar = self.lookalikes.get(c.lower(), '')
+        if c != c.lower():
+            return c + ''.join(v for v in similar if v.isupper())
+        return ''.join(OrderedDict.fromkeys(c + c.upper() + similar))
+
+    def letters(self, text):
+        """Pattern of the letters of a word in their OCR variants"""
+        classes = []
+        for c in text:
+            variants = self.variants(c)
+            if len(variants) == 1:
+                classes.append(re.escape(c))
+            else:
+                classes.append('[' + re.escape(variants) + ']')
+        return ''.join(classes)
+
+    def word(self, word):
+        """Pattern of a word of the table"""
+        letters, ending = self.split(word)
+        return self.letters(letters) + self.endings[ending]
+
+    def branch(self, node):
+        """Pattern of a node of the trie: the longer phrases first, then
+        the phrases ending here
+        """
+        alternatives = []
+        for key, child in node.items():
+            if key == (' ',):
+                alternatives.append(self.space + self.branch(child))
+            elif isinstance(key, tuple):
+                alternatives.append(self.endings[key[0]] + self.branch(child))
+            elif key is not None:
+                alternatives.append(self.letters(key) + self.branch(child))
+        alternatives += self.ends(node.get(None, ()))
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    def automaton(self, trie, start=''):
+        """Pattern of a trie, behind a test of the first letters (one set
+        test rejects most places in a text before the alternatives, and
+        the start test, are tried)
+        """
+        firsts = [self.variants(key) for key in trie if isinstance(key, str)]
+        if len(firsts) < len(trie):
+            return start + self.branch(trie)
+        return "(?=[" + re.escape(''.join(firsts)) + "])" + start + self.branch(trie)
+
+    def ends(self, ends):
+        """Patterns of the ends of the phrases stopping at a node: by
+        default the phrases just end there
+        """
+        return [""] if ends else []
+
+
+class AgeClassifier(PhraseAutomaton):
+    """Reader ages of the records: kid, junior and teen columns (see
+    RecordBatch.numbers), 1 if the record is addressed to the age group,
+    «(Для младш. и сред, возраста.)» → 1, 1, 0.
+
+    The phrases of the table (see age_groups.txt) are compiled into one
+    pattern (see PhraseAutomaton), run over the tails of a batch, once;
+    the phrase found tells its flag by the name of the empty group at
+    its end.
+    """
+    fields = ('kid', 'junior', 'teen')
+
+    def __init__(self, phrases):
+        ends = []
+        for flag, phrase in phrases:
+            if flag not in self.fields:
+                raise ValueError("unknown age group {!r}: {}".format(flag, phrase))
+            words, _, context = phrase.partition('>')
+            ends.append((words.split(), (context.split(), flag)))
+        self.pattern = re.compile(self.automaton(self.trie(ends), r"(?<!\p{L})"))
+
+    def ends(self, ends):
+        """The flags of the phrases, those with a context first"""
+        alternatives = []
+        for context, flag in sorted(ends, key=lambda end: not end[0]):
+            ahead = ''
+            if context:
+                ahead = "(?=" + self.space + self.space.join(map(self.word, context)) + ")"
+            alternatives.append(ahead + "(?<{}>)".format(flag))
+        return alternatives
+
+    def parse(self, tails):
+        """The age group columns (arrays) of a list of tails"""
+        n = len(tails)
+        columns = OrderedDict((flag, array('q', [0]) * n) for flag in self.fields)
+        text, ends, _ = join_tails(tails)
+        for m in self.pattern.finditer(text):
+            columns[m.lastgroup][bisect_right(ends, m.start())] = 1
+        return columns
+
+    def __call__(self, batch):
+        """Add the age group columns to a RecordBatch"""
+        batch.numbers.update(self.parse(batch.tail))
+        return batch
+
+
+def load_gazetteer(path):
+    """Read a gazetteer (kind, name and forms, tab-separated, per line)
+    into a list of (kind, name, forms) tuples
+    """
+    entries = []
+    for line in load_names(path):
+        kind, name, *forms = line.split('\t')
+        entries.append((kind, name, tuple(forms)))
+    return entries
+
+
+class Gazetteer(PhraseAutomaton):
+    """Places, publishers and series of the records: location,
+    publisher_name and series_name columns (see RecordBatch.labels) with
+    the names of the gazetteer (see gazetteer.txt), several joined with
+    '; ' as in the author column: «М.—Л.: Детгиз, 1950. (Школьная б-ка)»
+    → Москва; Ленинград, Детгиз, Школьная библиотека. The reviews (Рец.:)
+    are not tagged.
+
+    The forms of the names of a kind are compiled into one pattern (see
+    PhraseAutomaton), behind the text they are looked for after (the end
+    of a sentence, a comma, a parenthesis), and the pattern is run over
+    the tails of a batch, once. The kinds are not alternatives of a
+    single pattern: the regex engine gets several times slower on
+    alternatives that do not start with a literal. Nor does a form tell
+    its name by a group of its own, for the engine slows down with every
+    group: the form found is folded (case, look-alikes, dots, commas and
+    spaces, as the pattern lets them vary) and looked up.
+    """
+    fields = ('location', 'publisher_name', 'series_name')
+    kinds = ('place', 'publisher', 'series')
+    # the text before a form and the text after it (not taken by the
+    # match, it may be the text before the next one: М.—Л.); the
+    # punctuation includes its OCR misreadings (М„ Детгиз)
+    contexts = {
+        'place': (r"(?:[.,;)»’\"—–\]]|(?<=(?<!\p{L})\p{Lu}\.)-)[^\S\n]*",
+                  r"(?=[^\S\n]*[—–-]|\.?[^\S\n]*[,:„*])"),
+        'publisher': (r"[,:„][^\S\n]*«?", r"(?=\.?»?[^\S\n]*(?:[,;.\d\n]|\Z))"),
+        'series': (r"\([^\S\n]*", r""),
+    }
+
+    def __init__(self, entries):
+        self.folding = str.maketrans(
+            {v: c for c, similar in self.lookalikes.items() for v in similar})
+        self.folding.update(str.maketrans('', '', '.,'))
+        self.names = {kind: {} for kind in self.kinds}
+        forms = {kind: [] for kind in self.kinds}
+        for kind, name, variants in entries:
+            if kind not in self.kinds:
+                raise ValueError("unknown kind {!r}: {}".format(kind, name))
+            for form in (name,) + variants:
+                if '*' in form:
+                    raise ValueError("a prefix cannot be named: {}".format(form))
+                key = self.fold(form)
+                if self.names[kind].setdefault(key, name) != name:
+                    raise ValueError("{} is {} and {}".format(
+                        form, self.names[kind][key], name))
+                forms[kind].append((form.split(), None))
+        self.patterns = OrderedDict()
+        for kind in self.kinds:
+            before, after = self.contexts[kind]
+            self.patterns[kind] = re.compile(
+                before + "(?<form>" + self.automaton(self.trie(forms[kind])) + ")" + after)
+
+    def fold(self, text):
+        """The lookup key of a form: the text as the pattern sees it (the
+        spaces of the pattern are any but the newline)
+        """
+        return ''.join(text.split()).translate(self.folding).lower()
+
+    def parse(self, tails):
+        """The name columns (lists) of a list of tails"""
+        text, ends, stops = join_tails(tails)
+        columns = OrderedDict()
+        for field, (kind, pattern) in zip(self.fields, self.patterns.items()):
+            found = [[] for _ in tails]
+            for m in pattern.finditer(text):
+                i = bisect_right(ends, m.start('form'))
+                if m.start('form') < stops.get(i, len(text)):
+                    name = self.names[kind][self.fold(m.group('form'))]
+                    if name not in found[i]:
+                        found[i].append(name)
+            columns[field] = ['; '.join(names) for names in found]
+        return columns
+
+    def __call__(self, batch):
+        """Add the name columns to a RecordBatch"""
+        batch.labels.update(self.parse(batch.tail))
+        return batch
 
 
-# def extract_title(row):
-#     head = row[:-1]
-#     tail = row[-1]
-#     re.compile(r'')
-    
-    
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Split scanned txt file into numbered records (CSV)', epilog=""" The idea is to rely on the sequentially numbered items. The script
 identifies all lines that look like a numbered item. All non-itemlike
 lines are joined to the previous numbered line, until the next tem in
 a sequence is encountered. When an expected next item is missing, a
 'MISSING' tag is printed in the output CSV file.""")
-    parser.add_argument('infile', nargs='?', help='Input file (txt)',
-                        type=argparse.FileType('r', encoding='UTF-8'), default=sys.stdin)
-    parser.add_argument('outfile', nargs='?', help='Output file (csv)',
-                        type=argparse.FileType('w', encoding='UTF-8'), default=sys.stdout)
+    parser.add_argument('infiles', nargs='*', metavar='infile',
+                        help='Input files (txt) or glob patterns, processed '
+                        'in order (default: stdin). For compatibility, of '
+                        'an input file and a .csv or new file, the latter is '
+                        'the output file')
+    parser.add_argument('-o', '--outfile', metavar='FILE', help='Output file (csv)')
+    parser.add_argument('--header', help='Write a row of column names first',
+                        action='store_true')
+    parser.add_argument('--tag-volume', help='Add a volume column (input file '
+                        'name without extension) in front of every row; on by '
+                        'default with several input files', action='store_true')
+    parser.add_argument('--tag-section', help='Add a section column (e.g. '
+                        'fiction/foreign, see scripts/sections.txt) in front '
+                        'of every row', action='store_true')
+    parser.add_argument('--sections', metavar='KEYS', type=lambda s: s.split(','),
+                        help='Only process and write the records of these '
+                        'sections and their subsections (comma-separated '
+                        'keys of sections.txt, e.g. fiction,nonfiction/books); '
+                        'implies --tag-section')
     parser.add_argument('-v', '--verbose', help='Show regex debugging output',
                         action='store_true')
-    return parser.parse_args()
+    parser.add_argument('-t', '--timeout', metavar='SECONDS', type=float,
+                        default=1.0, help='Time budget for the author '
+                        'matching of a single record; slower records are '
+                        'tagged ERRTIMEOUT (default: %(default)s, 0 — no limit)')
+    parser.add_argument('--no-mmap', help='Read the input line by line '
+                        'instead of memory-mapping it', action='store_true')
+    parser.add_argument('--offsets', help='Add byte offset and length of '
+                        'every record in the input file after the line numbers',
+                        action='store_true')
+    parser.add_argument('--index', metavar='FILE', help='Write a sidecar '
+                        'index of item numbers and byte offsets to FILE (with '
+                        'several input files: a directory for VOLUME.idx files)')
+    parser.add_argument('--align', choices=['greedy', 'lis'], default='greedy',
+                        help='Item numbering: greedy line by line (default) '
+                        'or the longest increasing sequence of numbers in the '
+                        'volume (reports rejected numbers, -v lists them)')
+    parser.add_argument('--fields', help='Extract the fields of the '
+                        'description into columns after the author: ' +
+                        ', '.join(DESCRIPTION_FIELDS) + ' (the tail is kept)',
+                        action='store_true')
+    parser.add_argument('--printruns', help='Parse the printruns into '
+                        'integer columns before the tail: ' +
+                        ', '.join(PrintrunParser.fields) + ' (1 if the '
+                        'number needs checking); they replace the printrun '
+                        'column of --fields', action='store_true')
+    parser.add_argument('--prices', help='Parse the page counts and prices '
+                        'into integer columns before the tail: ' +
+                        ', '.join(PriceParser.fields) + ' (in kopecks, '
+                        'the latter in the rubles of 1961); they replace the '
+                        'pages and price columns of --fields', action='store_true')
+    parser.add_argument('--years', help='Parse the years of publication into '
+                        'integer columns before the tail: ' +
+                        ', '.join(YearParser.fields) + ' (1 if the year is '
+                        'not in the period of the volume); they replace the '
+                        'year column of --fields', action='store_true')
+    parser.add_argument('--ages', help='Flag the age groups the records are '
+                        'addressed to, in columns before the tail: ' +
+                        ', '.join(AgeClassifier.fields) + ' (phrases from '
+                        'age_groups.txt)', action='store_true')
+    parser.add_argument('--gazetteer', help='Tag the places, publishers and '
+                        'series with their names from gazetteer.txt, in '
+                        'columns before the tail: ' + ', '.join(Gazetteer.fields),
+                        action='store_true')
+    parser.add_argument('--edges', metavar='FILE', help='Write the author–illustrator '
+                        'edge list (volume, item, author, illustrator) to FILE; '
+                        'needs --fields')
+    parser.add_argument('--contents', metavar='FILE', help='Write the contents lists of '
+                        'the collections (volume, item, position, author, title) '
+                        'to FILE instead of the tails')
+    parser.add_argument('--raw-join', help='Join the lines of a record with '
+                        'spaces only, without repairing hyphenation and split '
+                        'words', action='store_true')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Number of worker processes for author (and field) '
+                        'extraction')
+    parser.add_argument('--single-authors', metavar='FILE', action='append',
+                        default=[], help='Additional list of single-name '
+                        'authors, one per line (may be repeated)')
+    args = parser.parse_args()
+    if args.outfile is None and len(args.infiles) == 2:
+        # the baseline form: infile outfile. The output is a .csv or a new
+        # file; not a volume mistyped (txt/1958-1960.tx) nor a file that
+        # would be overwritten
+        infile, target = args.infiles
+        ext = os.path.splitext(target)[1]
+        if glob.has_magic(target) or ext == '.txt' and os.path.exists(target):
+            pass
+        elif ext == '.csv' or not (os.path.exists(target) or '.txt'.startswith(ext or '-')):
+            if os.path.isfile(infile):
+                args.outfile = args.infiles.pop()
+        else:
+            parser.error('{} is not an input file nor a .csv or new output file; '
+                         'give the output file with -o'.format(target))
+    infiles = []
+    for pattern in args.infiles:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                parser.error('no input files match {}'.format(pattern))
+            infiles.extend(matches)
+        elif not os.path.exists(pattern):
+            parser.error('no such input file: {}'.format(pattern))
+        else:
+            infiles.append(pattern)
+    args.infiles = infiles
+    if args.edges and not args.fields:
+        parser.error('--edges needs --fields')
+    if (args.offsets or args.index) and not args.infiles:
+        parser.error('--offsets and --index need an input file')
+    if len(args.infiles) > 1:
+        args.tag_volume = True
+    if args.sections:
+        args.tag_section = True
+        keys = set(load_headings(SECTIONS_FILE).values())
+        for section in args.sections:
+            if not known_section(section, keys):
+                parser.error('unknown section {} (see {})'.format(section, SECTIONS_FILE))
+    # the output files last, once the arguments are checked
+    output = argparse.FileType('w', encoding='UTF-8')
+    try:
+        args.outfile = output(args.outfile) if args.outfile else sys.stdout
+        args.edges = args.edges and output(args.edges)
+        args.contents = args.contents and output(args.contents)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    return args
+
+
+def volume_name(path):
+    """Volume name of an input file: txt/1958-1960.txt → 1958-1960"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def volume_period(name):
+    """First and last year of a volume from its name: 1958-1960 → (1958,
+    1960); None if the name is not a period
+    """
+    m = re.fullmatch(r"(?<first>(?:18|19|20)\d\d)[—–-](?<last>(?:18|19|20)\d\d)", name)
+    return (int(m.group('first')), int(m.group('last'))) if m else None
+
+
+def written_fields(fields, parsers):
+    """The fields of a FieldExtractor written to the rows: those the batch
+    parsers (PrintrunParser...) do not replace with their columns
+    """
+    if not fields:
+        return ()
+    replaced = set(chain.from_iterable(
+        getattr(parser, 'replaces', ()) for parser in parsers if parser))
+    return tuple(field for field in fields.fields if field not in replaced)
+
+
+def header(args, fields=None, parsers=()):
+    """The column names of the rows of split_volume() (see
+    RecordBatch.rows()); parsers are the batch parsers in the order they
+    are applied
+    """
+    columns = ['volume'] * bool(args.tag_volume) + ['section'] * bool(args.tag_section)
+    columns += ['start', 'end'] + ['offset', 'length'] * bool(args.offsets)
+    columns += ['num', 'author'] + list(written_fields(fields, parsers))
+    for parser in parsers:
+        if parser:
+            columns += parser.fields
+    return columns + ['tail']
+
+
+def split_volume(infile, csv_writer, extractor, args, headings, index=None,
+                 join=' '.join, fields=None, printruns=None, prices=None,
+                 years=None, ages=None, gazetteer=None, edges=None, contents=None):
+    """Split one input file (an open text file or a path) into records and
+    write them as CSV rows
+    """
+    volume = None
+    if isinstance(infile, str) and not args.no_mmap:
+        volume = Volume(infile)
+        lines = volume.lines()
+    elif isinstance(infile, str):
+        infile = open(infile, encoding='UTF-8')
+        lines = numbered_lines(infile)
+    else:
+        lines = numbered_lines(infile)
+    name = getattr(infile, 'name', infile)
+    furniture = PageFurniture()
+    lines = furniture.strip(lines)
+    sections = SectionTracker(headings)
+    lines = sections.strip(lines)
+    if args.align == 'lis':
+        rejected = []
+        records = list(align_records(lines, rejected, join=join))
+        print("{}: {} items, {} missing, {} numbered lines rejected".format(
+            name, len(records),
+            sum(1 for rec in records if rec.tail == 'MISSING'), len(rejected)),
+            file=sys.stderr)
+        if args.verbose:
+            for lineno, n, txt in rejected:
+                print("rejected line {}: {}. {}".format(lineno, n, txt[:60]), file=sys.stderr)
+    else:
+        records = iter_records(lines, join=join)
+    records = sections.label(records)
+    if args.sections:
+        records = (rec for rec in records if in_sections(rec.section, args.sections))
+    if contents:
+        records = contents.cut(records)
+    rows = extract_authors(records, extractor, jobs=args.jobs, fields=fields)
+    columns = ('num', 'author')
+    columns += written_fields(fields, (printruns, prices, years))
+    if args.offsets or index:
+        if volume is None:
+            volume = Volume(name)
+        rows = volume.locate(rows)
+    if index:
+        itemindex = ItemIndex()
+    for batch in batches(rows, fields=columns):
+        if printruns:
+            printruns(batch)
+        if prices:
+            prices(batch, volume_name(name))
+        if years:
+            years(batch, volume_name(name))
+        if ages:
+            ages(batch)
+        if gazetteer:
+            gazetteer(batch)
+        csv_writer.writerows(batch.rows(
+            offsets=args.offsets, section=args.tag_section,
+            volume=volume_name(name) if args.tag_volume else None,
+            contents=not (contents and contents.writer)))
+        if index:
+            itemindex.add(batch)
+        if edges:
+            edges.add(batch, volume_name(name))
+        if contents and contents.writer:
+            contents.add(batch, volume_name(name))
+    if index:
+        itemindex.save(index)
+    print("{}: removed {} page numbers, {} running heads".format(
+        name, furniture.counts['page numbers'], furniture.counts['running heads']),
+        file=sys.stderr)
+    if volume is not None:
+        volume.close()
+    if not isinstance(infile, str) and infile is not sys.stdin:
+        infile.close()
 
 
 def main():
     """main processing"""
     args = parse_arguments()
     csv_writer = csv.writer(args.outfile)
-    author = None
-    for rec in iter_records(numbered_lines(args.infile)):
-        row = extract_author(rec, author, verbose=args.verbose)
-        author = row['author']
-        csv_writer.writerow(row.serialize())
+    single_authors = load_names(SINGLE_AUTHORS_FILE)
+    for path in args.single_authors:
+        single_authors.extend(load_names(path))
+    extractor = AuthorExtractor(verbose=args.verbose,
+                                single_authors=single_authors,
+                                timeout=args.timeout or None)
+    headings = load_headings(SECTIONS_FILE)
+    rejoiner = None if args.raw_join else Rejoiner()
+    fields = FieldExtractor() if args.fields else None
+    printruns = PrintrunParser() if args.printruns else None
+    prices = PriceParser() if args.prices else None
+    years = YearParser() if args.years else None
+    ages = AgeClassifier(load_age_groups(AGE_GROUPS_FILE)) if args.ages else None
+    gazetteer = Gazetteer(load_gazetteer(GAZETTEER_FILE)) if args.gazetteer else None
+    edges = EdgeList(csv.writer(args.edges)) if args.edges else None
+    contents = Contents(csv.writer(args.contents) if args.contents else None)
+    if args.header:
+        csv_writer.writerow(header(args, fields, (printruns, prices, years, ages, gazetteer)))
+    for path in args.infiles or [sys.stdin]:
+        index = args.index
+        if index and len(args.infiles) > 1:
+            os.makedirs(index, exist_ok=True)
+            index = os.path.join(index, volume_name(path) + '.idx')
+        if rejoiner:
+            rejoiner.reset()
+        split_volume(path, csv_writer, extractor, args, headings, index=index,
+                     join=rejoiner or ' '.join, fields=fields,
+                     printruns=printruns, prices=prices, years=years, ages=ages,
+                     gazetteer=gazetteer, edges=edges, contents=contents)
+    if args.verbose:
+        if rejoiner:
+            print("rejoined words: {}".format(dict(rejoiner.repairs)), file=sys.stderr)
+        for name, info in extractor.cache_info().items():
+            print("{}: {hits} hits, {misses} misses ({hitrate:.1%})".format(name, **info),
+                  file=sys.stderr)
 
 
 if __name__ == '__main__':
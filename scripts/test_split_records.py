@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Regression checks for split_records.py (run with make test)"""
+
+import os
+import subprocess
+import sys
+
+import split_records as sr
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'split_records.py')
+
+
+def test_imprint_before_review_without_dot():
+    # 1932-1939, item 3649: «Рец:» without a dot, and an imprint that
+    # names two publishers
+    rec = sr.Record("— Черниговский полк ждет. Обл. и илл. Н. Купреянова. М., "
+                    "Огиз — «Молодая гвардия», 1932. Стр. 55. Т. 25 300. Ц. 1 р. "
+                    "10 к., пер. 40 к. (Для старшего возраста.) Рец: бюллетень "
+                    "Детская и юношеская литература, 1933. № 6. Стр. 9—10. Б. "
+                    "Брайнина.")
+    sr.FieldExtractor()(rec)
+    assert (rec.place, rec.publisher, rec.year) == ('М.', 'Огиз — «Молодая гвардия»', '1932')
+
+
+FRONT_MATTER = """ДЕТСКАЯ ЛИТЕРАТУРА
+Указатель
+
+  1. Абрамов В. Детские странствия. М., Детгиз, 1959.
+  2. Абрамов В. Комок-Ушан
+(Сказка в стихах). Курск, Кн. изд., 1959.
+"""
+
+
+def test_first_item_starts_at_its_line():
+    for split in (sr.iter_records, sr.align_records):
+        records = list(split(sr.numbered_lines(FRONT_MATTER.splitlines(True))))
+        assert [(rec.num, rec.start, rec.end) for rec in records] == [(1, 4, 4), (2, 5, 6)]
+
+
+def test_index_fetches_first_item(tmp_path):
+    # as make records runs it
+    txt, idx = tmp_path / 'volume.txt', tmp_path / 'volume.idx'
+    txt.write_text(FRONT_MATTER, encoding='UTF-8')
+    subprocess.run([sys.executable, SCRIPT, '--index', str(idx), str(txt),
+                    str(tmp_path / 'volume.csv')], check=True)
+    index = sr.ItemIndex.load(str(idx))
+    assert index.fetch(1, str(txt)).strip() == "1. Абрамов В. Детские странствия. М., Детгиз, 1959."
+    assert index.fetch(2, str(txt)).startswith("  2. Абрамов В. Комок-Ушан\n")
+
+
+def test_rejoiner_forgets_previous_volume():
+    rejoiner = sr.Rejoiner()
+    rejoiner(['научно-популярная'] * 3)
+    assert rejoiner(['научно-', 'популярная']) == 'научно-популярная'
+    rejoiner.reset()
+    assert rejoiner(['научно-', 'популярная']) == 'научнопопулярная'
+
+
+def test_parsed_columns_replace_the_text(tmp_path):
+    txt, out = tmp_path / 'volume.txt', tmp_path / 'volume.csv'
+    txt.write_text(FRONT_MATTER, encoding='UTF-8')
+    subprocess.run([sys.executable, SCRIPT, '--fields', '--printruns', '--prices',
+                    '--years', str(txt), str(out)], check=True)
+    with open(str(out), encoding='UTF-8') as f:
+        row = next(sr.csv.reader(f))
+    # start, end, num, author, the fields but printrun, pages, price and
+    # year, the parsed columns, the tail
+    assert len(row) == 4 + 7 + len(sr.PrintrunParser.fields + sr.PriceParser.fields
+                                   + sr.YearParser.fields) + 1
+    assert row.count('1959') == 1
+
+
+def test_bibitem_compares_with_items_and_integers():
+    assert sr.BibItem(12) == 12 and sr.BibItem(12, 1) > 12
+    assert sr.BibItem(12) == sr.BibItem(string='12') != sr.BibItem(string='12а')
+    assert sr.BibItem(1) != None and sr.BibItem(1) != 'x'
+    assert sr.BibItem(12) != '12'
+    assert sorted([sr.BibItem(13), sr.BibItem(12, 1), 12]) == [12, sr.BibItem(12, 1), 13]
+
+
+def run(*args):
+    return subprocess.run([sys.executable, SCRIPT] + list(args), stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def test_command_line_files(tmp_path):
+    txt = tmp_path / 'volume.txt'
+    txt.write_text(FRONT_MATTER, encoding='UTF-8')
+    # the output file of the two-argument form need not end in .csv
+    assert run(str(txt), str(tmp_path / 'volume.out')).returncode == 0
+    with open(str(tmp_path / 'volume.out'), encoding='UTF-8') as f:
+        assert [row[2] for row in sr.csv.reader(f)] == ['1', '2']
+    # a mistyped volume or an existing file is not taken for the output
+    (tmp_path / 'notes.md').write_text('keep', encoding='UTF-8')
+    for target in ('volume.tx', 'notes.md'):
+        result = run(str(txt), str(tmp_path / target))
+        assert result.returncode == 2 and 'give the output file with -o' in result.stderr
+    assert not (tmp_path / 'volume.tx').exists()
+    assert (tmp_path / 'notes.md').read_text(encoding='UTF-8') == 'keep'
+    result = run(str(txt), str(tmp_path / 'missing.txt'), '-o', str(tmp_path / 'out.csv'))
+    assert result.returncode == 2 and 'no such input file' in result.stderr
+    assert not (tmp_path / 'out.csv').exists()
+    result = run(str(tmp_path / '*.text'))
+    assert result.returncode == 2 and 'no input files match' in result.stderr
+    assert run('--header', '--offsets', '--fields', '--years', '--ages',
+               str(txt)).stdout.splitlines()[0] == ','.join(
+        ['start', 'end', 'offset', 'length', 'num', 'author', 'title', 'genre',
+         'illustrator', 'place', 'publisher', 'series', 'pages', 'printrun', 'price',
+         'age', 'year', 'year_out_of_range', 'kid', 'junior', 'teen', 'tail'])
+
+
+def test_no_items_no_records():
+    assert list(sr.iter_records(sr.numbered_lines(['ДЕТСКАЯ ЛИТЕРАТУРА\n']))) == []
+
+
+def test_sections_are_checked(tmp_path):
+    txt = tmp_path / 'volume.txt'
+    txt.write_text(FRONT_MATTER, encoding='UTF-8')
+    assert run('--sections', 'fiction,nonfiction/books', str(txt)).returncode == 0
+    result = run('--sections', 'fictoin', str(txt))
+    assert result.returncode == 2 and 'unknown section fictoin' in result.stderr
+
+
+def test_gazetteer_forms_with_any_space():
+    gazetteer = sr.Gazetteer(sr.load_gazetteer(sr.GAZETTEER_FILE))
+    tails = ['Стихи. М., «Дет.{}лит.», 1975.'.format(space) for space in ' \xa0\u2009\r']
+    names = gazetteer.parse(tails)['publisher_name']
+    assert len(set(names)) == 1 and names[0]
+
+
+def test_format_multi_authors_keeps_the_last():
+    # as the baseline: a dot is added before scanning
+    assert sr.format_multi_authors("Ильф И. и Петров Е") == 'Ильф, И.; Петров, Е.'
+    assert sr.format_multi_authors("Бианки Виталий и Чаплина Вера") == 'Бианки, Виталий; Чаплина, Вера'
+    assert sr.format_multi_authors("Гримм, братья и Перро Ш.") == 'Перро, Ш.'
+
+
+def test_spaced_and_split_headings():
+    # 1967-1969, line 36460; 1970-1971, line 9223
+    lines = ["Л И Т Е Р А Т У Р А З А Р У Б Е Ж Н Ы Х\n", "С Т Р А Н\n",
+             "  1. Андерсен Г.-Х. Сказки. М., Детгиз, 1967.\n",
+             "               СБОРН ИКИ\n",
+             "  2. Сказки народов мира. М., Дет. лит., 1967.\n"]
+    tracker = sr.SectionTracker(sr.load_headings(sr.SECTIONS_FILE))
+    records = list(tracker.label(sr.iter_records(tracker.strip(sr.numbered_lines(lines)))))
+    assert [rec.section for rec in records] == ['fiction/foreign', 'fiction/collections']
+    assert sr.heading_key("Л И Т Е Р А Т У Р А  З А Р У Б Е Ж Н Ы Х") == 'ЛИТЕРАТУРА ЗАРУБЕЖНЫХ'
+
+
+def test_genre_runs_to_its_end():
+    fields = sr.FieldExtractor()
+    tails = {"Комок-Ушан (Сказка в стихах)'. Рис. И. Н. Лучи-ниной. Курск, Кн. изд., 1959. 21 стр.":
+             ('Комок-Ушан', 'Сказка в стихах', 'Лучи-нина, И. Н.', 'Курск', '1959'),
+             "Эй ты: Пьеса в 2-х д., 8-ми карт./Геннадий Мамлин. — М.: Искусство, 1975.":
+             ('Эй ты', 'Пьеса в 2-х д., 8-ми карт', '', 'М.', '1975'),
+             # no dot after the genre: it must not take the illustrator
+             # nor the imprint
+             "Часовые Кремля. Рассказы о В. И. Ленине Рис. И. Ильинского. М., Детгиз, 1960.":
+             ('Часовые Кремля', 'Рассказы о В. И. Ленине', 'Ильинский, И.', 'М.', '1960'),
+             "Кукты. Повесть Рис А Дронова М., Детгиз, 1963. 157 стр.":
+             ('Кукты', '', '', '', '1963')}
+    for tail, expected in tails.items():
+        rec = fields(sr.Record(tail))
+        assert (rec.title, rec.genre, rec.illustrator, rec.place, rec.year) == expected
+
+
+def test_missing_items_have_no_fields():
+    rec = sr.FieldExtractor()(sr.Record('MISSING'))
+    assert rec.title == rec.genre == '' and rec.tail == 'MISSING'
+
+
+def test_printrun_columns():
+    columns = sr.PrintrunParser().parse(
+        ['115 000 (1—90 тыс.) экз.', 'Стр. 24. Т. 15 000.', '101—200 тыс.',
+         'т. 50 ооО экз.', 'экз. 000 экз'])
+    assert [list(c) for c in columns.values()] == [[115000, 15000, 100000, 50000, -1],
+                                                   [1, -1, 100001, -1, -1],
+                                                   [90000, -1, 200000, -1, -1],
+                                                   [0, 0, 0, 1, 1]]
+
+
+def test_price_columns():
+    columns = sr.PriceParser().parse(
+        ['Стр. 38. 3 р. 80 к.', '175 с. и 4 л. илл. 38 к.', 'Б. ц.',
+         '173 стр. 11 р. Рец.: 5 р.', 'р. к. стр.'], '1958-1960')
+    assert [list(c) for c in columns.values()] == [[38, 175, -1, 173, -1],
+                                                   [-1, 4, -1, -1, -1],
+                                                   [380, 38, 0, 1100, -1],
+                                                   [38, 4, 0, 110, -1]]
+    assert list(sr.PriceParser().parse(['3 р. 80 к.'], '1970-1971')['price_1961_kop']) == [380]
+
+
+def test_year_columns():
+    columns = sr.YearParser().parse(
+        ['М., Детгиз, 1960.', 'То же. 1963.', 'М., I960', 'М., 1955120 стр.',
+         '1.9.60 Рец.: 1959'], '1958-1960')
+    assert [list(c) for c in columns.values()] == [[1960, 1963, 1960, 1955, -1],
+                                                   [0, 1, 0, 1, 0]]
+
+
+def test_age_columns():
+    columns = sr.AgeClassifier(sr.load_age_groups(sr.AGE_GROUPS_FILE)).parse(
+        ['(Для младш. и сред, возраста.)', 'Для дошкольного возраста',
+         'Для младшего школьного возраста', 'Для ст. дошк. возраста',
+         'Для возраста.'])
+    assert [list(c) for c in columns.values()] == [[1, 1, 1, 1, 0],
+                                                   [1, 0, 0, 0, 0],
+                                                   [0, 0, 0, 0, 0]]
+
+
+def test_gazetteer_columns():
+    columns = sr.Gazetteer(sr.load_gazetteer(sr.GAZETTEER_FILE)).parse(
+        ['Рис. В. Лебедева. М.—Л.: Детгиз, 1950. (Школьная б-ка)',
+         'Стихи. М., «Дет. лит.», 1975.', 'Рец.: Лит. газ., М.: Детгиз',
+         'Стихи. М.—Л. Детгиз 1950 Школьная б-ка'])
+    assert list(columns.values()) == [
+        ['Москва; Ленинград', 'Москва', '', 'Москва'],
+        ['Детгиз', 'Детская литература', '', ''],
+        ['Школьная библиотека', '', '', '']]